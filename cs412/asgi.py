@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs412.settings')
+os.environ.setdefault('VOTER_ANALYTICS_ASYNC_GRAPHS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,38 @@
+"""
+Shared plotly chart rendering for the cs412 apps.
+
+Charts are rendered as a small <div> plus the JSON figure spec. The plotly.js
+library itself is served once from a versioned URL (see plotly_js below) that
+browsers cache indefinitely, instead of being inlined into every chart.
+"""
+
+from functools import lru_cache
+
+import plotly
+import plotly.io as pio
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_safe
+from plotly.offline import get_plotlyjs
+
+# URL path of the plotly.js bundle; the version changes the URL on upgrade
+PLOTLY_JS_PATH = f'charts/plotly-{plotly.__version__}.min.js'
+
+
+def render_chart(figure):
+    '''Return HTML that draws figure (a plotly figure or dict) using the
+    shared plotly.js, which the page must load with the plotly_js URL.'''
+    return pio.to_html(figure, include_plotlyjs=False, full_html=False)
+
+
+@lru_cache(maxsize=1)
+def plotly_js_source():
+    '''Return the minified plotly.js bundle shipped with the plotly package.'''
+    return get_plotlyjs().encode('utf-8')
+
+
+@require_safe
+@cache_control(public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+def plotly_js(request):
+    '''Serve plotly.js with far-future caching headers.'''
+    return HttpResponse(plotly_js_source(), content_type='application/javascript; charset=utf-8')
@@ -89,6 +89,41 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # voter_analytics charts, keyed by filter signature and data version.
+    # LocMemCache evicts least recently used entries beyond MAX_ENTRIES; use a
+    # shared backend (file, memcached, redis) so that an import invalidates
+    # every worker at once.
+    'voter_analytics': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'voter-analytics',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 512,
+            'CULL_FREQUENCY': 8,
+        },
+    },
+}
+
+# where voter_analytics computes its graphs: 'rollup' sums the precomputed
+# VoterRollup table, 'columnar' filters an in-memory NumPy copy of the voters
+VOTER_ANALYTICS_BACKEND = 'rollup'
+
+# where the importer writes the memory-mapped voter snapshots read by the
+# 'columnar' backend
+VOTER_ANALYTICS_SNAPSHOT_DIR = BASE_DIR / 'data' / 'snapshots'
+
+# serve the voter graphs with the async view; cs412/asgi.py turns this on,
+# since under WSGI an async view only adds the cost of an event loop
+VOTER_ANALYTICS_ASYNC_GRAPHS = os.environ.get('VOTER_ANALYTICS_ASYNC_GRAPHS') == '1'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
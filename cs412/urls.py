@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
+from .charts import PLOTLY_JS_PATH, plotly_js
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,6 +28,7 @@ urlpatterns = [
     path("voter_analytics/", include("voter_analytics.urls")), # ASSIGN 3-7
     path("dadjokes/", include("dadjokes.urls")), # ASSIGN 10
     path("project/", include("project.urls")), # FINAL PROJ
+    path(PLOTLY_JS_PATH, plotly_js, name="plotly_js"), # shared chart library
     
 ] 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
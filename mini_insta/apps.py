@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    '''Put back search index triggers dropped by table rebuilds during migrate.'''
+    from .search import restore_triggers
+    restore_triggers(connections[using])
 
 
 class MiniInstaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mini_insta'
+
+    def ready(self):
+        post_migrate.connect(restore_search_triggers, sender=self)
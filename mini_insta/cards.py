@@ -0,0 +1,28 @@
+# mini_insta/cards.py
+# loading of everything a post card shows in a fixed number of queries
+
+from django.db.models import Exists, OuterRef, Prefetch
+from .models import Comment, Like, Photo
+
+# comments previewed under each post
+PREVIEW_COMMENTS = 2
+
+
+def post_cards(queryset, viewer=None):
+    '''Return queryset set up for rendering post cards.
+
+       Each post gets its profile, its first photo in first_photos and its
+       first PREVIEW_COMMENTS comments (with their authors) in top_comments,
+       plus viewer_liked when a viewer is given; like and comment counts are
+       stored on the post.  A page of any size costs three queries: the posts
+       and two prefetches.'''
+    queryset = queryset.select_related('profile')
+    if viewer is not None:
+        queryset = queryset.annotate(
+            viewer_liked=Exists(Like.objects.filter(post=OuterRef('pk'), profile=viewer)))
+
+    return queryset.prefetch_related(
+        Prefetch('photos', queryset=Photo.objects.order_by('id')[:1], to_attr='first_photos'),
+        Prefetch('comments', queryset=Comment.objects.select_related('profile').order_by('id')[:PREVIEW_COMMENTS],
+                 to_attr='top_comments'),
+    )
@@ -0,0 +1,53 @@
+# mini_insta/counters.py
+# denormalized follower, post, like and comment counts, kept on the rows
+# they describe and repaired by `manage.py recount`
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Comment, Follow, Like, Post, Profile
+
+# every counter: (model, counter field, model counted, field of the counted
+# model pointing back at the row)
+COUNTERS = [
+    (Profile, 'follower_count', Follow, 'profile'),
+    (Profile, 'following_count', Follow, 'follower_profile'),
+    (Profile, 'post_count', Post, 'profile'),
+    (Post, 'like_count', Like, 'post'),
+    (Post, 'comment_count', Comment, 'post'),
+]
+
+
+def adjust(obj, **deltas):
+    '''Add deltas to counter fields of obj with a single UPDATE using F()
+       expressions, so concurrent changes are not lost.  Counters never go
+       below zero.  The in-memory object is left alone.'''
+    changes = {}
+    for field, delta in deltas.items():
+        if delta >= 0:
+            changes[field] = F(field) + delta
+        else:
+            changes[field] = Greatest(F(field) + delta, Value(0))
+    type(obj).objects.filter(pk=obj.pk).update(**changes)
+
+
+def count_of(model, link):
+    '''Subquery counting the rows of model whose link field is the outer row.'''
+    counts = (model.objects.filter(**{link: OuterRef('pk')}).order_by()
+              .values(link).annotate(n=Count('id')).values('n'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def recount():
+    '''Recompute every counter from the edges and fix the rows that drifted.
+       Returns {counter field: number of rows fixed}.'''
+    fixed = {}
+    for model, field, counted, link in COUNTERS:
+        with transaction.atomic():
+            drifted = (model.objects.annotate(actual=count_of(counted, link))
+                       .exclude(**{field: F('actual')})
+                       .values_list('pk', 'actual'))
+            rows = [model(pk=pk, **{field: actual}) for pk, actual in drifted]
+            model.objects.bulk_update(rows, [field], batch_size=1000)
+        fixed[field] = len(rows)
+    return fixed
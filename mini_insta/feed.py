@@ -0,0 +1,122 @@
+# mini_insta/feed.py
+# materialized home feeds: posts are copied into each follower's feed when
+# they are created (fan-out on write), except for profiles with so many
+# followers that their posts are merged in when the feed is read instead
+
+import heapq
+from django.db import transaction
+from django.db.models import Q
+from .models import Follow, FeedItem, Post, Profile
+from .pagination import CursorPage, seek_before
+
+# profiles with more followers than this are switched to fan-out on read
+FANOUT_LIMIT = 5000
+
+# number of a profile's latest posts copied into a feed when it is followed
+BACKFILL_POSTS = 100
+
+# rows written per INSERT when fanning out
+BATCH_SIZE = 1000
+
+
+def feed_item(follower_id, post):
+    '''Return an unsaved FeedItem putting post in the feed of follower_id.'''
+    return FeedItem(profile_id=follower_id, post=post, author_id=post.profile_id,
+                    timestamp=post.timestamp)
+
+
+def update_fan_out_mode(profile):
+    '''Switch profile to fan-out on read once it has more than FANOUT_LIMIT
+       followers.  The switch is one way, so a profile hovering around the
+       limit does not flip back and forth.'''
+    if not profile.fan_out_on_read and Follow.objects.filter(profile=profile)[FANOUT_LIMIT:].exists():
+        profile.fan_out_on_read = True
+        Profile.objects.filter(pk=profile.pk).update(fan_out_on_read=True)
+    return profile.fan_out_on_read
+
+
+def fan_out(post):
+    '''Copy a new post into the feed of every follower of its author.'''
+    if post.profile.fan_out_on_read:
+        return 0
+
+    followers = (Follow.objects.filter(profile_id=post.profile_id)
+                 .values_list('follower_profile_id', flat=True))
+    items = [feed_item(follower_id, post) for follower_id in followers.iterator()]
+    with transaction.atomic():
+        FeedItem.objects.bulk_create(items, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(items)
+
+
+def refresh_post(post):
+    '''Carry an edited post's new timestamp over to the feeds holding it.'''
+    FeedItem.objects.filter(post=post).update(timestamp=post.timestamp)
+
+
+def followed(profile, follower):
+    '''Backfill follower's feed with the latest posts of a profile they just followed.'''
+    if update_fan_out_mode(profile):
+        return 0
+
+    posts = Post.objects.filter(profile=profile).order_by('-timestamp', '-id')[:BACKFILL_POSTS]
+    items = [feed_item(follower.pk, post) for post in posts]
+    FeedItem.objects.bulk_create(items, ignore_conflicts=True)
+    return len(items)
+
+
+def unfollowed(profile, follower):
+    '''Remove the posts of a profile follower no longer follows from their feed.'''
+    return FeedItem.objects.filter(profile=follower, author=profile).delete()[0]
+
+
+def feed_keys(profile, limit=None, before=None):
+    '''Return (timestamp, post id) pairs for profile's feed, newest first.
+
+       The materialized part is one range scan over the feed index; posts of
+       followed profiles that fan out on read are fetched from Post and merged
+       in.  before, a (timestamp, post id) pair, starts the feed after that post.'''
+    items = (FeedItem.objects.filter(Q(profile=profile) & seek_before(before, id_field='post_id'))
+             .order_by('-timestamp', '-post_id')
+             .values_list('timestamp', 'post_id'))
+    sources = [items[:limit] if limit else items]
+
+    celebrities = Follow.objects.filter(follower_profile=profile, profile__fan_out_on_read=True)
+    celebrity_ids = list(celebrities.values_list('profile_id', flat=True))
+    if celebrity_ids:
+        posts = (Post.objects.filter(Q(profile_id__in=celebrity_ids) & seek_before(before))
+                 .order_by('-timestamp', '-id')
+                 .values_list('timestamp', 'id'))
+        sources.append(posts[:limit] if limit else posts)
+
+    keys = []
+    seen = set()
+    # a post written before its author switched modes can come from both sources
+    for key in heapq.merge(*sources, reverse=True):
+        if key[1] not in seen:
+            seen.add(key[1])
+            keys.append(key)
+            if limit and len(keys) == limit:
+                break
+    return keys
+
+
+def load_posts(keys, queryset=None):
+    '''Return the Posts of keys, in order, loaded from queryset (for example
+       one set up by cards.post_cards()) when given.'''
+    if queryset is None:
+        queryset = Post.objects.select_related('profile')
+    posts = queryset.in_bulk([pk for timestamp, pk in keys])
+    return [posts[pk] for timestamp, pk in keys if pk in posts]
+
+
+def feed_posts(profile, limit=None, before=None, queryset=None):
+    '''Return the Posts of profile's feed, newest first.'''
+    return load_posts(feed_keys(profile, limit, before), queryset)
+
+
+def feed_page(profile, per_page, before=None, queryset=None):
+    '''Return the CursorPage of profile's feed after before.  Its cursor is
+       the feed's own key of the last post, since a feed entry's timestamp
+       need not match the post's.'''
+    keys = feed_keys(profile, per_page + 1, before)
+    return CursorPage(load_posts(keys[:per_page], queryset), per_page, keys)
@@ -37,4 +37,15 @@ class CreateProfileForm(forms.ModelForm):
     class Meta:
         '''associate this form with a model from our database.'''
         model = Profile
-        fields = ['username','display_name','profile_image_url', 'bio_text']
\ No newline at end of file
+        fields = ['username','display_name','profile_image_url', 'bio_text']
+
+class CreateCommentForm(forms.ModelForm):
+    '''a form to add a Comment to a post.'''
+
+    # comments may not be empty, although the model allows it
+    text = forms.CharField(widget=forms.Textarea(attrs={'rows': 2}))
+
+    class Meta:
+        '''associate this form with a model from our database.'''
+        model = Comment
+        fields = ['text']
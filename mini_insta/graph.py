@@ -0,0 +1,39 @@
+# mini_insta/graph.py
+# follow-graph lookups: single follow checks are one indexed EXISTS query on
+# the (profile, follower_profile) unique index
+
+from django.db.models import Exists, OuterRef
+from .models import Follow
+
+
+def is_following(follower, profile):
+    '''Return True if follower follows profile.  Touches at most one row of
+       the (profile, follower_profile) unique index, however many followers
+       profile has.'''
+    if follower is None or profile is None:
+        return False
+    return Follow.objects.filter(profile=profile, follower_profile=follower).exists()
+
+
+def following_set(follower, profiles=None):
+    '''Return the set of ids of the profiles follower follows, limited to
+       profiles (ids or Profiles) when given, for checking many at once with
+       one query.'''
+    follows = Follow.objects.filter(follower_profile=follower)
+    if profiles is not None:
+        follows = follows.filter(profile__in=profiles)
+    return set(follows.values_list('profile_id', flat=True))
+
+
+def is_mutual(a, b):
+    '''Return True if a and b follow each other.'''
+    return is_following(a, b) and is_following(b, a)
+
+
+def mutual_follows(profile):
+    '''Return the set of ids of the profiles that profile follows and that
+       follow profile back.'''
+    follows_back = Follow.objects.filter(profile=profile, follower_profile=OuterRef('profile'))
+    return set(Follow.objects.filter(follower_profile=profile)
+               .filter(Exists(follows_back))
+               .values_list('profile_id', flat=True))
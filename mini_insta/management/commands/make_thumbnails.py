@@ -0,0 +1,31 @@
+# mini_insta/management/commands/make_thumbnails.py
+# manage.py command to make thumbnails for photos uploaded before they existed
+
+from django.core.management.base import BaseCommand
+from mini_insta.models import Photo
+from mini_insta.thumbnails import make_thumbnails
+
+
+class Command(BaseCommand):
+    '''Make the grid, feed and full-size renditions of uploaded photos.'''
+
+    help = 'Make thumbnails for uploaded mini_insta photos that do not have them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='remake thumbnails of photos that already have them')
+
+    def handle(self, *args, **options):
+        '''make thumbnails and report how many photos were done or skipped.'''
+        photos = Photo.objects.exclude(image_file='').order_by('id')
+        if not options['force']:
+            photos = photos.filter(thumbnails={})
+
+        made = skipped = 0
+        for photo in photos.iterator():
+            if make_thumbnails(photo):
+                made += 1
+            else:
+                skipped += 1
+                self.stderr.write(f'  photo {photo.pk}: could not read {photo.image_file.name}')
+        self.stdout.write(self.style.SUCCESS(f'Done. Made thumbnails for {made} photos, skipped {skipped}.'))
@@ -0,0 +1,18 @@
+# mini_insta/management/commands/recount.py
+# manage.py command to repair the denormalized mini_insta counters
+
+from django.core.management.base import BaseCommand
+from mini_insta.counters import recount
+
+
+class Command(BaseCommand):
+    '''Recompute the follower, following, post, like and comment counters.'''
+
+    help = 'Recompute the mini_insta follower, following, post, like and comment counters.'
+
+    def handle(self, *args, **options):
+        '''recount and report how many rows had drifted.'''
+        fixed = recount()
+        for field, rows in fixed.items():
+            self.stdout.write(f'  {field}: fixed {rows} rows')
+        self.stdout.write(self.style.SUCCESS(f'Done. Fixed {sum(fixed.values())} counters.'))
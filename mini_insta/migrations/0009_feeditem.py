@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# values of feed.FANOUT_LIMIT and feed.BACKFILL_POSTS when this migration was written
+FANOUT_LIMIT = 5000
+BACKFILL_POSTS = 100
+
+
+def build_feeds(apps, schema_editor):
+    '''Fill the feeds of existing followers with the latest posts of the
+       profiles they follow, and switch heavily followed profiles to fan-out on read.'''
+    Profile = apps.get_model('mini_insta', 'Profile')
+    Post = apps.get_model('mini_insta', 'Post')
+    Follow = apps.get_model('mini_insta', 'Follow')
+    FeedItem = apps.get_model('mini_insta', 'FeedItem')
+
+    popular = (Follow.objects.values('profile').annotate(n=Count('id'))
+               .filter(n__gt=FANOUT_LIMIT).values_list('profile', flat=True))
+    Profile.objects.filter(pk__in=list(popular)).update(fan_out_on_read=True)
+
+    latest = {}
+    for follow in Follow.objects.filter(profile__fan_out_on_read=False).iterator():
+        if follow.profile_id not in latest:
+            latest[follow.profile_id] = list(Post.objects.filter(profile_id=follow.profile_id)
+                                             .order_by('-timestamp', '-id')[:BACKFILL_POSTS])
+        FeedItem.objects.bulk_create(
+            [FeedItem(profile_id=follow.follower_profile_id, post=post, author_id=post.profile_id,
+                      timestamp=post.timestamp) for post in latest[follow.profile_id]],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0008_profile_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='fan_out_on_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mini_insta.profile')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='mini_insta.post')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='mini_insta.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', '-timestamp', '-post'], name='feeditem_profile_time_idx'), models.Index(fields=['profile', 'author'], name='feeditem_profile_author_idx')],
+                'constraints': [models.UniqueConstraint(fields=('profile', 'post'), name='feeditem_profile_post_unique')],
+            },
+        ),
+        migrations.RunPython(build_feeds, migrations.RunPython.noop),
+    ]
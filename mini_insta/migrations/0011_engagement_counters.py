@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:44
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    '''Count the existing follows, posts, likes and comments into the new fields.'''
+    Profile = apps.get_model('mini_insta', 'Profile')
+    Post = apps.get_model('mini_insta', 'Post')
+    Follow = apps.get_model('mini_insta', 'Follow')
+    Like = apps.get_model('mini_insta', 'Like')
+    Comment = apps.get_model('mini_insta', 'Comment')
+
+    def count_of(model, link):
+        counts = (model.objects.filter(**{link: OuterRef('pk')}).order_by()
+                  .values(link).annotate(n=Count('id')).values('n'))
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Profile.objects.update(
+        follower_count=count_of(Follow, 'profile'),
+        following_count=count_of(Follow, 'follower_profile'),
+        post_count=count_of(Post, 'profile'),
+    )
+    Post.objects.update(
+        like_count=count_of(Like, 'post'),
+        comment_count=count_of(Comment, 'post'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0010_post_time_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
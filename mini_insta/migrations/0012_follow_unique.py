@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:46
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    '''Keep the oldest of each set of duplicate follows, then recount the
+       follower and following counters of the profiles involved.'''
+    Profile = apps.get_model('mini_insta', 'Profile')
+    Follow = apps.get_model('mini_insta', 'Follow')
+
+    duplicates = (Follow.objects.values('profile', 'follower_profile')
+                  .annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1))
+    touched = set()
+    for row in duplicates:
+        Follow.objects.filter(profile=row['profile'], follower_profile=row['follower_profile']) \
+            .exclude(pk=row['keep']).delete()
+        touched.update([row['profile'], row['follower_profile']])
+    if not touched:
+        return
+
+    def count_of(link):
+        counts = (Follow.objects.filter(**{link: OuterRef('pk')}).order_by()
+                  .values(link).annotate(n=Count('id')).values('n'))
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Profile.objects.filter(pk__in=touched).update(
+        follower_count=count_of('profile'),
+        following_count=count_of('follower_profile'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0011_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('profile', 'follower_profile'), name='follow_profile_follower_unique'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:48
+
+from django.db import migrations
+
+
+# the SQL of mini_insta/search.py when this migration was written
+CREATE_SQL = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS mini_insta_post_fts USING fts5(
+        caption, content='mini_insta_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS mini_insta_profile_fts USING fts5(
+        username, display_name, bio_text, content='mini_insta_profile', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+    '''CREATE TRIGGER IF NOT EXISTS mini_insta_post_fts_ai AFTER INSERT ON mini_insta_post BEGIN
+        INSERT INTO mini_insta_post_fts(rowid, caption) VALUES (new.id, new.caption);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS mini_insta_post_fts_ad AFTER DELETE ON mini_insta_post BEGIN
+        INSERT INTO mini_insta_post_fts(mini_insta_post_fts, rowid, caption) VALUES ('delete', old.id, old.caption);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS mini_insta_post_fts_au AFTER UPDATE OF caption ON mini_insta_post BEGIN
+        INSERT INTO mini_insta_post_fts(mini_insta_post_fts, rowid, caption) VALUES ('delete', old.id, old.caption);
+        INSERT INTO mini_insta_post_fts(rowid, caption) VALUES (new.id, new.caption);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS mini_insta_profile_fts_ai AFTER INSERT ON mini_insta_profile BEGIN
+        INSERT INTO mini_insta_profile_fts(rowid, username, display_name, bio_text)
+            VALUES (new.id, new.username, new.display_name, new.bio_text);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS mini_insta_profile_fts_ad AFTER DELETE ON mini_insta_profile BEGIN
+        INSERT INTO mini_insta_profile_fts(mini_insta_profile_fts, rowid, username, display_name, bio_text)
+            VALUES ('delete', old.id, old.username, old.display_name, old.bio_text);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS mini_insta_profile_fts_au
+        AFTER UPDATE OF username, display_name, bio_text ON mini_insta_profile BEGIN
+        INSERT INTO mini_insta_profile_fts(mini_insta_profile_fts, rowid, username, display_name, bio_text)
+            VALUES ('delete', old.id, old.username, old.display_name, old.bio_text);
+        INSERT INTO mini_insta_profile_fts(rowid, username, display_name, bio_text)
+            VALUES (new.id, new.username, new.display_name, new.bio_text);
+    END''',
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS mini_insta_post_fts_ai',
+    'DROP TRIGGER IF EXISTS mini_insta_post_fts_ad',
+    'DROP TRIGGER IF EXISTS mini_insta_post_fts_au',
+    'DROP TRIGGER IF EXISTS mini_insta_profile_fts_ai',
+    'DROP TRIGGER IF EXISTS mini_insta_profile_fts_ad',
+    'DROP TRIGGER IF EXISTS mini_insta_profile_fts_au',
+    'DROP TABLE IF EXISTS mini_insta_post_fts',
+    'DROP TABLE IF EXISTS mini_insta_profile_fts',
+]
+
+
+def create_fts(apps, schema_editor):
+    '''Create and fill the FTS5 indexes on SQLite; other databases use the fallback search.'''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+    for table in ('mini_insta_post_fts', 'mini_insta_profile_fts'):
+        schema_editor.execute(f"INSERT INTO {table}({table}) VALUES('rebuild')")
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0012_follow_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
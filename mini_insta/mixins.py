@@ -12,8 +12,10 @@ class ProfileLoginRequiredMixin(LoginRequiredMixin):
     def get_profile(self):
         '''get the profile associated with the logged-in user'''
         # For users with multiple profiles, get the first one
-        profile = get_object_or_404(Profile, user=self.request.user)
-        return profile
+        # look it up once per request
+        if not hasattr(self, '_profile'):
+            self._profile = get_object_or_404(Profile, user=self.request.user)
+        return self._profile
     
     def get_context_data(self, **kwargs):
         '''add profile to context'''
@@ -17,6 +17,16 @@ class Profile(models.Model):
     bio_text = models.TextField(blank=True)
     join_date = models.DateTimeField(auto_now=True)
 
+    # set once the profile has too many followers to copy each post into every
+    # follower's feed; its posts are then read from Post when a feed is shown
+    fan_out_on_read = models.BooleanField(default=False)
+
+    # counts kept up to date by the views that add and remove edges, so stats
+    # are read from the row; `manage.py recount` repairs any drift
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         '''return a string representation of this model instance'''
         return f'{self.username} or 'f'{self.display_name}'
@@ -31,32 +41,32 @@ class Profile(models.Model):
     
     def get_followers(self):
         '''returns list of follower profiles.'''
-        followers = Follow.objects.filter(profile=self)
+        followers = Follow.objects.filter(profile=self).select_related('follower_profile')
         return [follow.follower_profile for follow in followers]
     
     def get_num_followers(self):
         '''returns the count of followers for this profile.'''
-        return Follow.objects.filter(profile=self).count()
+        return self.follower_count
     
     def get_following(self):
         '''returns a list of Profiles that this profile is following.'''
-        following = Follow.objects.filter(follower_profile = self)
+        following = Follow.objects.filter(follower_profile = self).select_related('profile')
         return [follow.profile for follow in following]
     
     def get_num_following(self):
         '''returns the count of how many profiles this profile is following.'''
-        return Follow.objects.filter(follower_profile=self).count()
+        return self.following_count
     
     def get_post_feed(self):
         '''shows post for each of the profiles being followed by a given user with 
         the most recent at the top.'''
-        following_profiles = self.get_following()
-        posts = Post.objects.filter(profile__in=following_profiles).order_by('-timestamp')
-        return posts
+        from .feed import feed_posts
+        return feed_posts(self)
     
-    def is_followed_by(self):
+    def is_followed_by(self, profile):
         '''check if this profile is followed by another profile'''
-        return Follow.objects.filter(profile=self, follower_profile=profile).exists()
+        from .graph import is_following
+        return is_following(profile, self)
     
 class Post(models.Model):
     '''Model the data attributes of an Instagram Post.'''
@@ -66,6 +76,18 @@ class Post(models.Model):
     timestamp = models.DateTimeField(auto_now=True)
     caption = models.TextField(blank=True)
 
+    # counts kept up to date by the like and comment views; see Profile
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # a profile's posts, newest first, paged on (timestamp, id)
+            models.Index(fields=['profile', '-timestamp', '-id'], name='post_profile_time_idx'),
+            # all posts newest first, for search results and feeds read from Post
+            models.Index(fields=['-timestamp', '-id'], name='post_time_idx'),
+        ]
+
     def __str__(self):
         '''return a string representation of this model instance.'''
         return f'{self.profile} created a post at {self.timestamp} captioned {self.caption}.'
@@ -73,6 +95,13 @@ class Post(models.Model):
     def get_all_photos(self):
         '''a getter method to find and return all Photos for a given Post.'''
         return Photo.objects.filter(post=self)
+
+    def get_first_photo(self):
+        '''return the first Photo of this post, or None; uses the photo
+        preloaded by cards.post_cards() when there is one.'''
+        if hasattr(self, 'first_photos'):
+            return self.first_photos[0] if self.first_photos else None
+        return self.get_all_photos().order_by('id').first()
     
     def get_all_comments(self):
         '''find and return all comments for a post.'''
@@ -90,6 +119,9 @@ class Photo(models.Model):
     image_url = models.URLField(blank=True) # image URL string
     timestamp = models.DateTimeField(auto_now=True)
     image_file = models.ImageField(blank=True) # an image file
+    # renditions made by thumbnails.make_thumbnails(): {size: {'width',
+    # 'height', 'webp', 'jpeg'}} with the stored file names
+    thumbnails = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         '''return a string representation of this model instance.'''
@@ -102,6 +134,33 @@ class Photo(models.Model):
             return self.image_file.url
         else:
             return self.image_url
+
+    def get_renditions(self, *sizes):
+        '''return src and webp/jpeg srcset strings for the given thumbnail
+            sizes, or None if this photo has no thumbnails.'''
+        if not all(size in self.thumbnails for size in sizes):
+            return None
+        url = self.image_file.storage.url
+        entries = []
+        for size in sizes:
+            # sizes a small original did not reach share one rendition
+            if self.thumbnails[size] not in entries:
+                entries.append(self.thumbnails[size])
+        return {
+            'src': url(entries[0]['jpeg']),
+            'width': entries[0]['width'],
+            'height': entries[0]['height'],
+            'webp': ', '.join(f"{url(e['webp'])} {e['width']}w" for e in entries),
+            'jpeg': ', '.join(f"{url(e['jpeg'])} {e['width']}w" for e in entries),
+        }
+
+    def get_grid_images(self):
+        '''the square thumbnail for the profile grid.'''
+        return self.get_renditions('grid')
+
+    def get_feed_images(self):
+        '''the feed-width and full-size renditions for feed and post pages.'''
+        return self.get_renditions('feed', 'full')
         
 class Follow(models.Model):
 
@@ -113,6 +172,12 @@ class Follow(models.Model):
     follower_profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='following')
     timestamp = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # also the index behind graph.is_following()
+            models.UniqueConstraint(fields=['profile', 'follower_profile'], name='follow_profile_follower_unique'),
+        ]
+
     def __str__(self):
         '''method to view Follow relationship as a string rep.'''
         return f'{self.follower_profile} follows {self.profile}.'
@@ -140,4 +205,29 @@ class Like(models.Model):
 
     def __str__(self):
         '''returns string rep of when this like was created'''
-        return f'{self.profile} liked {self.post} at {self.timestamp}.'
\ No newline at end of file
+        return f'{self.profile} liked {self.post} at {self.timestamp}.'
+
+class FeedItem(models.Model):
+    '''one post in one profile's home feed, written when the post is created
+       so that reading a feed is a single range scan.'''
+
+    # the profile whose feed this is
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='feed_items')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_items')
+    # the author of the post, so unfollowing can remove their posts without a join
+    author = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+')
+    # copy of post.timestamp, the feed's sort key
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'post'], name='feeditem_profile_post_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-timestamp', '-post'], name='feeditem_profile_time_idx'),
+            models.Index(fields=['profile', 'author'], name='feeditem_profile_author_idx'),
+        ]
+
+    def __str__(self):
+        '''returns string rep of this feed entry.'''
+        return f'{self.post} in the feed of {self.profile}.'
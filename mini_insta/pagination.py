@@ -0,0 +1,119 @@
+# mini_insta/pagination.py
+# cursor pagination of posts, newest first, keyed on (timestamp, id)
+
+import base64
+import json
+from datetime import datetime
+from django.db.models import Q
+from django.http import Http404
+
+
+def encode_cursor(key):
+    '''Pack a (timestamp, id) sort key into an opaque URL-safe string.'''
+    timestamp, pk = key
+    data = json.dumps([timestamp.isoformat(), pk], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    '''Unpack a cursor made by encode_cursor(); raises ValueError if it is malformed.'''
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, pk = json.loads(data)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'invalid cursor: {e}')
+
+
+def seek_before(key, timestamp_field='timestamp', id_field='id'):
+    '''Q selecting rows that come after key in newest-first order.  The
+       leading range on the timestamp keeps it usable by an index.'''
+    if key is None:
+        return Q()
+    timestamp, pk = key
+    return Q(**{f'{timestamp_field}__lte': timestamp}) & (
+        Q(**{f'{timestamp_field}__lt': timestamp}) | Q(**{f'{id_field}__lt': pk}))
+
+
+class CursorPage:
+    '''One page of posts and the cursor of the page after it.  keys, when
+       given, are the (timestamp, id) keys the page was read by, one per row
+       fetched, for rows sorted on something other than their own timestamp.'''
+
+    def __init__(self, object_list, per_page, keys=None):
+        self.has_next_page = len(object_list if keys is None else keys) > per_page
+        self.object_list = object_list[:per_page]
+        self.per_page = per_page
+        self.keys = keys
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def next_cursor(self):
+        '''cursor for the page after this one, or None on the last page.'''
+        if not self.has_next_page:
+            return None
+        if self.keys is not None:
+            return encode_cursor(self.keys[self.per_page - 1])
+        last = self.object_list[-1]
+        return encode_cursor((last.timestamp, last.pk))
+
+
+class RankedPage(CursorPage):
+    '''One page of results in relevance order, which has no seek key; the
+       cursor is the offset of the next page.'''
+
+    def __init__(self, object_list, per_page, offset):
+        super().__init__(object_list, per_page)
+        self.offset = offset
+
+    def next_cursor(self):
+        if not self.has_next_page:
+            return None
+        return str(self.offset + len(self.object_list))
+
+
+def paginate_posts(queryset, key, per_page):
+    '''Return the CursorPage of queryset starting after key, fetching one
+       extra row to learn whether another page follows.'''
+    posts = queryset.filter(seek_before(key)).order_by('-timestamp', '-id')
+    return CursorPage(list(posts[:per_page + 1]), per_page)
+
+
+class CursorPaginationMixin:
+    '''Pages a view's posts with a ?cursor= parameter instead of page numbers.
+       With ?fragment=1 only fragment_template_name is rendered, holding the
+       next page of posts and the link to the one after, for loading on scroll.'''
+
+    paginate_by = 24
+    fragment_template_name = None
+
+    def get_cursor_key(self):
+        '''the (timestamp, id) key from ?cursor=, or None for the first page.'''
+        cursor = self.request.GET.get('cursor')
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise Http404('Invalid page cursor.')
+
+    def get_cursor_page(self, queryset, per_page):
+        '''Return the CursorPage of queryset requested by this request.'''
+        return paginate_posts(queryset, self.get_cursor_key(), per_page)
+
+    def paginate_queryset(self, queryset, page_size):
+        '''ListView hook: page with a cursor instead of OFFSET.'''
+        page = self.get_cursor_page(queryset, page_size)
+        return (None, page, page.object_list, page.has_next() or self.get_cursor_key() is not None)
+
+    def get_template_names(self):
+        if self.fragment_template_name and self.request.GET.get('fragment'):
+            return [self.fragment_template_name]
+        return super().get_template_names()
@@ -0,0 +1,154 @@
+# mini_insta/search.py
+# ranked search of post captions and profiles, backed by SQLite FTS5 indexes
+# that triggers keep in step with the tables they index
+
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Post, Profile
+
+POST_FTS_TABLE = 'mini_insta_post_fts'
+PROFILE_FTS_TABLE = 'mini_insta_profile_fts'
+
+# bm25 weights of the profile columns: username, display_name, bio_text
+PROFILE_WEIGHTS = (10.0, 5.0, 1.0)
+
+# matches ranked per search; the newest this many matching posts are ranked,
+# so a query matching millions of posts costs no more than a rarer one
+MAX_CANDIDATES = 1000
+
+
+def fts_triggers(table, fts_table, columns):
+    '''Return (name, SQL) of the triggers copying inserts, updates and
+       deletes of table into its external-content FTS5 index.'''
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        (f'{fts_table}_ai', f'''CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new});
+        END'''),
+        (f'{fts_table}_ad', f'''CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old});
+        END'''),
+        (f'{fts_table}_au', f'''CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old});
+            INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new});
+        END'''),
+    ]
+
+
+# the triggers of each index, created by migration 0013.  Django rebuilds a
+# SQLite table for many schema changes and the rebuild drops its triggers, so
+# restore_triggers() puts them back after every migrate.
+TRIGGERS = {
+    POST_FTS_TABLE: fts_triggers('mini_insta_post', POST_FTS_TABLE, ['caption']),
+    PROFILE_FTS_TABLE: fts_triggers('mini_insta_profile', PROFILE_FTS_TABLE,
+                                    ['username', 'display_name', 'bio_text']),
+}
+
+
+def restore_triggers(connection):
+    '''Re-create any missing index trigger on connection and rebuild the
+       index it serves, which may have missed changes meanwhile.  Returns the
+       names of the rebuilt indexes.'''
+    if connection.vendor != 'sqlite':
+        return []
+    rebuilt = []
+    with connection.cursor() as cursor:
+        if POST_FTS_TABLE not in connection.introspection.table_names(cursor):
+            return []
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+        for fts_table, triggers in TRIGGERS.items():
+            missing = [sql for name, sql in triggers if name not in existing]
+            if missing:
+                for sql in missing:
+                    cursor.execute(sql)
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES('rebuild')")
+                rebuilt.append(fts_table)
+    return rebuilt
+
+
+_fts_found = False
+
+
+def fts_available():
+    '''True if the database is SQLite and the FTS indexes exist.'''
+    global _fts_found
+    if connection.vendor != 'sqlite':
+        return False
+    if not _fts_found:
+        _fts_found = POST_FTS_TABLE in connection.introspection.table_names()
+    return _fts_found
+
+
+def tokenize(query):
+    '''Split a search string into lower-case word tokens.'''
+    return re.findall(r'\w+', query.lower())
+
+
+def fts_query(tokens):
+    '''FTS5 MATCH expression requiring every token as a prefix.  The whole
+       word is matched as well, so rows holding the exact word score higher.'''
+    return ' AND '.join(f'("{token}" OR "{token}"*)' for token in tokens)
+
+
+def ranked_ids(fts_table, expression, offset, limit, weights=()):
+    '''Return ids of the rows matching expression, best first by BM25, from
+       the newest MAX_CANDIDATES matches.'''
+    rank = f'bm25({fts_table}, {", ".join(str(w) for w in weights)})' if weights else 'rank'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''SELECT id FROM (
+                    SELECT rowid AS id, {rank} AS score FROM {fts_table}
+                    WHERE {fts_table} MATCH %s ORDER BY rowid DESC LIMIT %s)
+                ORDER BY score, id DESC LIMIT %s OFFSET %s''',
+            [expression, MAX_CANDIDATES, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def in_order(queryset, ids):
+    '''Load the rows of queryset with the given ids, in that order.'''
+    rows = queryset.in_bulk(ids)
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def search_posts(query, offset=0, limit=24, queryset=None):
+    '''Return up to limit Posts whose caption matches every word of query as
+       a prefix, most relevant first, skipping the first offset.  queryset,
+       for example one set up by cards.post_cards(), loads the posts.'''
+    tokens = tokenize(query)
+    if queryset is None:
+        queryset = Post.objects.select_related('profile')
+    if not tokens:
+        return []
+
+    if not fts_available():
+        posts = queryset
+        for token in tokens:
+            posts = posts.filter(caption__icontains=token)
+        return list(posts.order_by('-timestamp', '-id')[offset:offset + limit])
+
+    ids = ranked_ids(POST_FTS_TABLE, fts_query(tokens), offset, limit)
+    return in_order(queryset, ids)
+
+
+def search_profiles(query, limit=20):
+    '''Return up to limit Profiles whose username, display name or bio
+       matches every word of query as a prefix, best matches first; a match
+       on the username counts most.'''
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    if not fts_available():
+        profiles = Profile.objects.all()
+        for token in tokens:
+            profiles = profiles.filter(Q(username__icontains=token) |
+                                       Q(display_name__icontains=token) |
+                                       Q(bio_text__icontains=token))
+        return list(profiles.order_by('username')[:limit])
+
+    ids = ranked_ids(PROFILE_FTS_TABLE, fts_query(tokens), 0, limit, PROFILE_WEIGHTS)
+    return in_order(Profile.objects.all(), ids)
@@ -1,3 +1,61 @@
+# mini_insta/tests.py
+# tests of the materialized home feed
+
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+from django.urls import reverse
+from .models import FeedItem, Follow, Post, Profile
+from .views import PostFeedListView
+
+
+class FeedTests(TestCase):
+
+    def setUp(self):
+        self.author = self.profile('author')
+        self.reader = self.profile('reader')
+        Follow.objects.create(profile=self.author, follower_profile=self.reader)
+
+    def profile(self, username):
+        user = User.objects.create_user(username, password='secret')
+        return Profile.objects.create(user=user, username=username)
+
+    def create_posts(self, count):
+        self.client.login(username='author', password='secret')
+        for n in range(count):
+            self.client.post(reverse('create_post'), {'caption': f'post {n}'})
+        self.client.logout()
+
+    def read_feed(self):
+        '''Page through the reader's feed and return the captions it shows.'''
+        self.client.login(username='reader', password='secret')
+        captions = []
+        cursor = None
+        # a cursor that repeats posts would page forever
+        for _ in range(Post.objects.count() + 1):
+            params = {'cursor': cursor} if cursor else {}
+            page = self.client.get(reverse('show_feed'), params).context['page_obj']
+            captions.extend(post.caption for post in page)
+            cursor = page.next_cursor()
+            if cursor is None:
+                return captions
+        self.fail(f'feed did not end: {captions}')
+
+    def test_feed_copies_the_saved_timestamp(self):
+        self.create_posts(3)
+        for post in Post.objects.all():
+            self.assertEqual(FeedItem.objects.get(post=post).timestamp, post.timestamp)
+
+    @mock.patch.object(PostFeedListView, 'paginate_by', 2)
+    def test_pages_show_every_post_once(self):
+        self.create_posts(5)
+        self.assertEqual(self.read_feed(), [f'post {n}' for n in reversed(range(5))])
 
-# Create your tests here.
+    @mock.patch.object(PostFeedListView, 'paginate_by', 2)
+    def test_pages_follow_the_feed_order(self):
+        self.create_posts(5)
+        # posts changed without carrying the change over to the feeds
+        Post.objects.update(timestamp=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self.read_feed(), [f'post {n}' for n in reversed(range(5))])
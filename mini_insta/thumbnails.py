@@ -0,0 +1,81 @@
+# mini_insta/thumbnails.py
+# fixed-size renditions of uploaded photos, made once at upload time and
+# stored next to the original, so pages never send full-size originals
+
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# rendition name: (width, height); a height makes a centred square crop,
+# None keeps the aspect ratio.  Images are never scaled up.
+SIZES = {
+    'grid': (300, 300),
+    'feed': (1080, None),
+    'full': (2048, None),
+}
+
+# every rendition is written in each format: (extension, Pillow format, options)
+FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def resize(image, width, height):
+    '''Return image scaled to width (and cropped to height, if given).'''
+    if height:
+        side = min(width, image.width, image.height)
+        return ImageOps.fit(image, (side, side), Image.LANCZOS)
+    if image.width <= width:
+        return image.copy()
+    return image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+
+def encode(image, fmt):
+    '''Return the bytes of image saved in fmt.'''
+    ext, pil_format, options = FORMATS[fmt]
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def delete_thumbnails(photo):
+    '''Remove the rendition files recorded on photo, before they are remade.'''
+    storage = photo.image_file.storage
+    names = {entry[fmt] for entry in photo.thumbnails.values() for fmt in FORMATS if entry.get(fmt)}
+    for name in names:
+        storage.delete(name)
+
+
+def make_thumbnails(photo):
+    '''Write every rendition of photo's uploaded file next to it and record
+       them in photo.thumbnails.  Returns False, leaving the photo alone, if
+       it has no uploaded file or the file is not a readable image.'''
+    if not photo.image_file:
+        return False
+    storage = photo.image_file.storage
+    try:
+        with photo.image_file.open('rb') as f:
+            original = ImageOps.exif_transpose(Image.open(f))
+            original = original.convert('RGB')
+    except (OSError, Image.DecompressionBombError):
+        return False
+
+    delete_thumbnails(photo)
+    stem = os.path.splitext(photo.image_file.name)[0]
+    thumbnails = {}
+    # a small original comes out the same at several sizes; write it once
+    by_dimensions = {}
+    for size, (width, height) in SIZES.items():
+        image = resize(original, width, height)
+        if image.size not in by_dimensions:
+            entry = {'width': image.width, 'height': image.height}
+            for fmt, (ext, *_) in FORMATS.items():
+                entry[fmt] = storage.save(f'{stem}_{size}.{ext}', ContentFile(encode(image, fmt)))
+            by_dimensions[image.size] = entry
+        thumbnails[size] = by_dimensions[image.size]
+
+    photo.thumbnails = thumbnails
+    photo.save(update_fields=['thumbnails'])
+    return True
@@ -25,5 +25,6 @@ urlpatterns = [
     path('profile/<int:pk>/delete_follow', DeleteFollowView.as_view(), name='delete_follow'),
     path('post/<int:pk>/like', LikeView.as_view(), name='like_post'),
     path('post/<int:pk>/delete_like', DeleteLikeView.as_view(), name='delete_like'),
+    path('post/<int:pk>/comment', CreateCommentView.as_view(), name='create_comment'),
 
 ]
\ No newline at end of file
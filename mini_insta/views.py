@@ -2,13 +2,18 @@
 # views for the mini_insta application
 # by Amy Ho, aho@bu.edu
 
-from django.db.models import Q
+from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404
 from django.views.generic import *
 from django.urls import reverse_lazy
 from .models import *
 from .forms import *
 from .mixins import ProfileLoginRequiredMixin
+from .pagination import CursorPaginationMixin, RankedPage
+from .cards import post_cards
+from .thumbnails import make_thumbnails
+from . import counters, feed, graph, search
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 
@@ -20,11 +25,12 @@ class ProfileListView(ListView):
     template_name = "mini_insta/show_all_profiles.html"
     context_object_name = "profiles"
 
-class ProfileView(DetailView):
+class ProfileView(CursorPaginationMixin, DetailView):
     '''Display a single profile.'''
 
     model = Profile
     template_name= 'mini_insta/show_profile.html'
+    fragment_template_name = 'mini_insta/profile_posts_page.html'
     context_object_name='profile'
 
     def get_context_data(self, **kwargs):
@@ -36,7 +42,14 @@ class ProfileView(DetailView):
         else:
             current_profile = None
 
+        # one page of the post grid
+        posts = post_cards(self.object.get_all_posts(), viewer=current_profile)
+        page = self.get_cursor_page(posts, self.paginate_by)
+        context['posts'] = page.object_list
+        context['page_obj'] = page
+
         context['current_profile'] = current_profile
+        context['is_following'] = graph.is_following(current_profile, self.object)
         return context
 
 class PostDetailView(DetailView):
@@ -84,18 +97,27 @@ class CreatePostView(ProfileLoginRequiredMixin, CreateView):
         # Set the profile for the post before saving
         post = form.save(commit=False)
         post.profile = profile
-        post.save()
+        with transaction.atomic():
+            post.save()
+            counters.adjust(profile, post_count=1)
+
+        # copy the new post into the followers' feeds
+        feed.fan_out(post)
 
         # handle uploaded image files
         files = self.request.FILES.getlist('files')
         for file in files:
-            Photo.objects.create(
+            photo = Photo.objects.create(
                 post=post,
                 image_file=file
             )
+            # grid, feed and full-size renditions served instead of the original
+            make_thumbnails(photo)
 
-        # redirect to the newly created post's detail page
-        return super().form_valid(form)
+        # redirect to the newly created post's detail page; the post is not
+        # saved again, which would move its timestamp past the feeds' copies
+        self.object = post
+        return redirect(self.get_success_url())
     
     def get_success_url(self):
         '''Redirect to the newly created post's detail page.'''
@@ -116,6 +138,13 @@ class DeletePostView(ProfileLoginRequiredMixin, DeleteView):
     model = Post
     template_name = 'mini_insta/delete_post_form.html'
 
+    def form_valid(self, form):
+        '''delete the post and take it off its author's post count.'''
+        with transaction.atomic():
+            response = super().form_valid(form)
+            counters.adjust(self.object.profile, post_count=-1)
+        return response
+
     def get_success_url(self):
         '''Return the URL to redirect to after a successful delete.'''
         return reverse_lazy('show_profile', kwargs={'pk': self.object.profile.pk})
@@ -127,6 +156,12 @@ class UpdatePostView(ProfileLoginRequiredMixin, UpdateView):
     form_class = UpdatePostForm
     template_name = 'mini_insta/update_post_form.html'
 
+    def form_valid(self, form):
+        '''save the post and move it up the feeds, since editing renews its timestamp.'''
+        response = super().form_valid(form)
+        feed.refresh_post(self.object)
+        return response
+
     def get_success_url(self):
         '''Return the URL to redirect to after a successful update.'''
         return reverse_lazy('show_post', kwargs={'pk': self.object.pk})
@@ -143,17 +178,24 @@ class ShowFollowingDetailView(DetailView):
     model = Profile
     template_name = 'mini_insta/show_following.html'
 
-class PostFeedListView(ProfileLoginRequiredMixin, ListView):
+class PostFeedListView(ProfileLoginRequiredMixin, CursorPaginationMixin, ListView):
     '''View class to display list of posts.'''
 
     model = Profile
     template_name = 'mini_insta/show_feed.html'
+    fragment_template_name = 'mini_insta/feed_page.html'
     context_object_name = 'posts'
+    paginate_by = 20
     
     def get_queryset(self):
-        '''Get the post feed for the specific profile'''
+        '''Get the posts copied into the feed of the specific profile'''
+        return Post.objects.filter(feed_items__profile=self.get_profile())
+
+    def get_cursor_page(self, queryset, per_page):
+        '''Read one page of the feed, including posts of profiles that fan out on read.'''
         profile = self.get_profile()
-        return profile.get_post_feed()
+        return feed.feed_page(profile, per_page, self.get_cursor_key(),
+                              queryset=post_cards(Post.objects.all(), viewer=profile))
     
     def get_context_data(self, **kwargs):
         '''Add the profile to context'''
@@ -161,9 +203,10 @@ class PostFeedListView(ProfileLoginRequiredMixin, ListView):
         context['profile'] = self.get_profile()
         return context
 
-class SearchView(ProfileLoginRequiredMixin, ListView):
+class SearchView(ProfileLoginRequiredMixin, CursorPaginationMixin, ListView):
     '''View class for searching Profiles and Posts.'''
     template_name = 'mini_insta/search_results.html'
+    fragment_template_name = 'mini_insta/search_posts_page.html'
     context_object_name = 'posts'
     
     def dispatch(self, request, *args, **kwargs):
@@ -178,13 +221,19 @@ class SearchView(ProfileLoginRequiredMixin, ListView):
         return super().dispatch(request, *args, **kwargs)
     
     def get_queryset(self):
-        '''Return Posts that match the search query.'''
+        '''Return the Posts to load search results from.'''
+        return post_cards(Post.objects.all(), viewer=self.get_profile())
+
+    def paginate_queryset(self, queryset, page_size):
+        '''Page the ranked matches; ?cursor= is the offset into them.'''
         query = self.request.GET.get('query', '').strip()
-        if query:
-            return Post.objects.filter(
-                Q(caption__icontains=query)
-            ).order_by('-timestamp')
-        return Post.objects.none()
+        try:
+            offset = max(int(self.request.GET.get('cursor') or 0), 0)
+        except ValueError:
+            raise Http404('Invalid page cursor.')
+        posts = search.search_posts(query, offset, page_size + 1, queryset=queryset)
+        page = RankedPage(posts, page_size, offset)
+        return (None, page, page.object_list, page.has_next() or offset > 0)
     
     def get_context_data(self, **kwargs):
         '''Add search results and profile to context.'''
@@ -197,15 +246,11 @@ class SearchView(ProfileLoginRequiredMixin, ListView):
         # Add query
         context['query'] = query
         
-        # Add matching profiles
-        if query:
-            context['matching_profiles'] = Profile.objects.filter(
-                Q(username__icontains=query) |
-                Q(display_name__icontains=query) |
-                Q(bio_text__icontains=query)
-            )
+        # Add matching profiles, except when only the next page of posts is wanted
+        if query and not self.request.GET.get('fragment'):
+            context['matching_profiles'] = search.search_profiles(query)
         else:
-            context['matching_profiles'] = Profile.objects.none()
+            context['matching_profiles'] = []
         
         return context
     
@@ -263,10 +308,16 @@ class FollowView(ProfileLoginRequiredMixin, TemplateView):
         # Prevent self-following
         if profile_to_follow != current_profile:
             # Check if follow relationship already exists
-            follow, created = Follow.objects.get_or_create(
-                profile=profile_to_follow,
-                follower_profile=current_profile
-            )
+            with transaction.atomic():
+                follow, created = Follow.objects.get_or_create(
+                    profile=profile_to_follow,
+                    follower_profile=current_profile
+                )
+                if created:
+                    counters.adjust(profile_to_follow, follower_count=1)
+                    counters.adjust(current_profile, following_count=1)
+            if created:
+                feed.followed(profile_to_follow, current_profile)
         
         # Redirect back to the profile page
         return redirect('show_profile', pk=profile_to_follow.pk)
@@ -282,10 +333,16 @@ class DeleteFollowView(ProfileLoginRequiredMixin, TemplateView):
         current_profile = self.get_profile()
         
         # Delete the follow relationship if it exists
-        Follow.objects.filter(
-            profile=profile_to_unfollow,
-            follower_profile=current_profile
-        ).delete()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                profile=profile_to_unfollow,
+                follower_profile=current_profile
+            ).delete()
+            if deleted:
+                counters.adjust(profile_to_unfollow, follower_count=-deleted)
+                counters.adjust(current_profile, following_count=-deleted)
+        if deleted:
+            feed.unfollowed(profile_to_unfollow, current_profile)
         
         # Redirect back to the profile page
         return redirect('show_profile', pk=profile_to_unfollow.pk)
@@ -301,10 +358,13 @@ class LikeView(ProfileLoginRequiredMixin, TemplateView):
         # Prevent liking own post
         if post_to_like.profile != current_profile:
             # Check if like already exists
-            like, created = Like.objects.get_or_create(
-                post=post_to_like,
-                profile=current_profile
-            )
+            with transaction.atomic():
+                like, created = Like.objects.get_or_create(
+                    post=post_to_like,
+                    profile=current_profile
+                )
+                if created:
+                    counters.adjust(post_to_like, like_count=1)
         
         # Redirect back to the post page
         return redirect('show_post', pk=post_to_like.pk)
@@ -318,10 +378,36 @@ class DeleteLikeView(ProfileLoginRequiredMixin, TemplateView):
         current_profile = self.get_profile()
         
         # Delete the like relationship if it exists
-        Like.objects.filter(
-            post=post_to_unlike,
-            profile=current_profile
-        ).delete()
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(
+                post=post_to_unlike,
+                profile=current_profile
+            ).delete()
+            if deleted:
+                counters.adjust(post_to_unlike, like_count=-deleted)
         
         # Redirect back to the post page
-        return redirect('show_post', pk=post_to_unlike.pk)
\ No newline at end of file
+        return redirect('show_post', pk=post_to_unlike.pk)
+
+class CreateCommentView(ProfileLoginRequiredMixin, CreateView):
+    '''View to comment on a post.'''
+
+    model = Comment
+    form_class = CreateCommentForm
+    http_method_names = ['post']
+
+    def form_valid(self, form):
+        '''attach the comment to the post and the logged-in profile, and count it.'''
+        post = get_object_or_404(Post, pk=self.kwargs['pk'])
+        comment = form.save(commit=False)
+        comment.post = post
+        comment.profile = self.get_profile()
+        with transaction.atomic():
+            comment.save()
+            counters.adjust(post, comment_count=1)
+        self.object = comment
+        return redirect('show_post', pk=post.pk)
+
+    def form_invalid(self, form):
+        '''an empty comment is ignored.'''
+        return redirect('show_post', pk=self.kwargs['pk'])
@@ -9,7 +9,7 @@ from .forms import CategoryForm, ItemForm, PurchaseRecordForm, UsageRecordForm
 from django.shortcuts import redirect
 from django.contrib import messages
 import plotly.graph_objs as go
-from plotly.offline import plot
+from cs412.charts import render_chart
 from django.db.models.functions import TruncMonth
 
 
@@ -212,11 +212,7 @@ class PurchaseRecordListView(ListView):
                 showlegend=False
             )
             
-            graph_div = plot(
-                {"data": [fig], "layout": layout},
-                auto_open=False,
-                output_type="div"
-            )
+            graph_div = render_chart({"data": [fig], "layout": layout})
             return graph_div
         
         return None
@@ -0,0 +1,36 @@
+// static/insta_scroll.js
+// infinite scroll for mini_insta: when a "Load more" link comes into view,
+// fetch the next page as an HTML fragment and put it in place of the link
+
+(function () {
+    function load(link) {
+        observer.unobserve(link);
+        fetch(link.dataset.fragment, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) throw new Error(response.status);
+                return response.text();
+            })
+            .then(function (html) {
+                link.insertAdjacentHTML('beforebegin', html);
+                link.remove();
+                watch();
+            })
+            .catch(function () {
+                // leave the plain link for the user to follow
+            });
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) load(entry.target);
+        });
+    }, {rootMargin: '600px'});
+
+    function watch() {
+        document.querySelectorAll('a.load-more[data-fragment]').forEach(function (link) {
+            observer.observe(link);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', watch);
+})();
@@ -0,0 +1,237 @@
+# voter_analytics/aggregates.py
+# aggregation of voter data for the graphs, computed inside the database
+
+import re
+from collections import Counter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum, F, Q
+from django.db.models.functions import ExtractYear
+from .models import ELECTIONS, ELECTION_BITS, Voter, VoterRollup
+
+# Voter fields that identify one VoterRollup group, besides the birth year
+ROLLUP_FIELDS = ['party_affiliation', 'voter_score', 'precinct_num', 'participation']
+
+# VoterRollup fields making up a group key, as used by rollup deltas
+ROLLUP_KEY = ROLLUP_FIELDS + ['birth_year']
+
+# result sets larger than this are counted from the rollups instead of COUNT(*)
+COUNT_THRESHOLD = 10000
+
+
+class ChartData:
+    '''Compact arrays behind the voter graphs: birth year bins, party counts
+       and election participation totals.'''
+
+    def __init__(self, years, year_counts, parties, party_counts, participation):
+        self.years = list(years)
+        self.year_counts = list(year_counts)
+        self.parties = list(parties)
+        self.party_counts = list(party_counts)
+        self.elections = [label for name, label in ELECTIONS]
+        self.participation = list(participation)
+        self.total = sum(self.year_counts)
+
+    @classmethod
+    def from_groups(cls, groups):
+        '''Build the arrays from rows of (party, birth year, count, per-election counts).'''
+        years = {}
+        parties = {}
+        participation = [0] * len(ELECTIONS)
+
+        for party, year, count, votes in groups:
+            years[year] = years.get(year, 0) + count
+            parties[party] = parties.get(party, 0) + count
+            for i, n in enumerate(votes):
+                participation[i] += n
+
+        return cls(
+            sorted(years), [years[y] for y in sorted(years)],
+            sorted(parties), [parties[p] for p in sorted(parties)],
+            participation,
+        )
+
+
+def grouped_rows(qs, birth_year, weight):
+    '''Return the single grouped query behind ChartData: one row per
+       (party, birth year) carrying the total weight and a conditional weight
+       for each election.  weight(filter) returns the aggregate to use.'''
+    election_counts = {f'n_{name}': weight(Q(participation__hasall=ELECTION_BITS[name]))
+                       for name, label in ELECTIONS}
+    return (qs.order_by()
+            .values('party_affiliation', year=birth_year)
+            .annotate(n=weight(None), **election_counts))
+
+
+def chart_data_from_rows(rows):
+    '''Build ChartData from the rows of grouped_rows().'''
+    return ChartData.from_groups(
+        (row['party_affiliation'], row['year'], row['n'] or 0,
+         [row[f'n_{name}'] or 0 for name, label in ELECTIONS])
+        for row in rows
+    )
+
+
+def grouped_chart_data(qs, birth_year, weight):
+    '''Compute ChartData from qs in a single grouped query.'''
+    return chart_data_from_rows(grouped_rows(qs, birth_year, weight))
+
+
+def voter_chart_data(voters):
+    '''Compute the data for all voter graphs from a (filtered) Voter queryset.'''
+    return grouped_chart_data(voters, ExtractYear('doB'), lambda q: Count('id', filter=q))
+
+
+def rollup_rows(rollups):
+    '''grouped_rows() for a (filtered) VoterRollup queryset, summing the precomputed counts.'''
+    return grouped_rows(rollups, F('birth_year'), lambda q: Sum('count', filter=q))
+
+
+def rollup_chart_data(rollups):
+    '''Compute the data for all voter graphs from a (filtered) VoterRollup
+       queryset, by summing the precomputed counts.'''
+    return chart_data_from_rows(rollup_rows(rollups))
+
+
+def use_columnar():
+    '''True when VOTER_ANALYTICS_BACKEND selects the NumPy snapshot and it can be used.'''
+    if getattr(settings, 'VOTER_ANALYTICS_BACKEND', 'rollup') != 'columnar':
+        return False
+    from . import columnar
+    return columnar.available()
+
+
+def chart_data(voter_filter):
+    '''Compute ChartData for a VoterFilter with the backend named by the
+       VOTER_ANALYTICS_BACKEND setting: 'rollup' (the default) sums the
+       VoterRollup table, 'columnar' uses the in-memory NumPy snapshot.'''
+    if use_columnar():
+        from . import columnar
+        return columnar.chart_data(voter_filter)
+
+    return rollup_chart_data(VoterRollup.objects.filter(voter_filter.rollup_q()))
+
+
+async def achart_data(voter_filter):
+    '''Async form of chart_data(): the rollup query is read with the async
+       ORM; the columnar backend, which does not touch the database per
+       request, is run in a worker thread.'''
+    if use_columnar():
+        from . import columnar
+        return await sync_to_async(columnar.chart_data)(voter_filter)
+
+    rows = rollup_rows(VoterRollup.objects.filter(voter_filter.rollup_q()))
+    return chart_data_from_rows([row async for row in rows])
+
+
+def precinct_key(precinct):
+    '''Sort key putting precincts in natural order: 2A before 10A.'''
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', precinct)]
+
+
+def precinct_turnout(voter_filter):
+    '''Return the turnout of every precinct in each election, broken down by
+       party, for the voters matching a VoterFilter.
+
+       All precincts come from one grouped query over VoterRollup: one row per
+       (precinct, party) with the number of voters and a conditional sum for
+       each election.  The result is plain lists and dicts, ready for JSON.'''
+    election_counts = {f'n_{name}': Sum('count', filter=Q(participation__hasall=bit))
+                       for name, bit in ELECTION_BITS.items()}
+    rows = (VoterRollup.objects.filter(voter_filter.rollup_q())
+            .order_by()
+            .values('precinct_num', 'party_affiliation')
+            .annotate(n=Sum('count'), **election_counts))
+
+    precincts = {}
+    for row in rows:
+        precinct = precincts.setdefault(row['precinct_num'], {
+            'precinct': row['precinct_num'].strip(),
+            'voters': 0,
+            'voted': dict.fromkeys(ELECTION_BITS, 0),
+            'parties': {},
+        })
+        voted = {name: row[f'n_{name}'] or 0 for name in ELECTION_BITS}
+        precinct['voters'] += row['n']
+        for name, n in voted.items():
+            precinct['voted'][name] += n
+        precinct['parties'][row['party_affiliation'].strip()] = {'voters': row['n'], 'voted': voted}
+
+    return [precincts[key] for key in sorted(precincts, key=precinct_key)]
+
+
+def voter_count(voter_filter, exact=False):
+    '''Return (count, exact) for the voters matching a VoterFilter.
+
+       The count is first estimated by summing the rollup groups, which is
+       exact as of the last import.  Only when that is at most COUNT_THRESHOLD
+       (or exact is requested) is a COUNT(*) run on Voter, since counting a
+       large filtered set costs about as much as reading it.'''
+    if not exact:
+        estimate = VoterRollup.objects.filter(voter_filter.rollup_q()).aggregate(n=Sum('count'))['n'] or 0
+        if estimate > COUNT_THRESHOLD:
+            return estimate, False
+
+    return Voter.objects.filter(voter_filter.voter_q()).count(), True
+
+
+def rebuild_rollups():
+    '''Replace the contents of VoterRollup with fresh counts from Voter.'''
+    groups = (Voter.objects.order_by()
+              .values(*ROLLUP_FIELDS, birth_year=ExtractYear('doB'))
+              .annotate(count=Count('id')))
+
+    with transaction.atomic():
+        VoterRollup.objects.all().delete()
+        VoterRollup.objects.bulk_create((VoterRollup(**group) for group in groups), batch_size=1000)
+    return VoterRollup.objects.count()
+
+
+def rollup_key(voter):
+    '''Return the ROLLUP_KEY of the group a Voter belongs to.'''
+    return (voter.party_affiliation, voter.voter_score, voter.precinct_num,
+            voter.participation, voter.doB.year)
+
+
+def stored_rollup_counts(voter_ids, batch_size=1000):
+    '''Return a Counter of {group key: voters} for the stored voters with
+       the given voter IDs, read batch_size IDs at a time.'''
+    counts = Counter()
+    for i in range(0, len(voter_ids), batch_size):
+        groups = (Voter.objects.filter(voter_id__in=voter_ids[i:i + batch_size])
+                  .order_by()
+                  .values(*ROLLUP_FIELDS, birth_year=ExtractYear('doB'))
+                  .annotate(n=Count('id')))
+        for group in groups:
+            counts[tuple(group[f] for f in ROLLUP_KEY)] += group['n']
+    return counts
+
+
+def apply_rollup_delta(delta):
+    '''Add a Counter of {group key: change in voters} to VoterRollup,
+       creating groups that appear and removing groups that empty, so that a
+       small re-import costs about as much as its changes.  Returns the
+       number of rollup groups.'''
+    changes = {key: n for key, n in delta.items() if n}
+    if changes:
+        with transaction.atomic():
+            existing = {tuple(row[:-2]): row[-2:] for row in
+                        VoterRollup.objects.values_list(*ROLLUP_KEY, 'pk', 'count').iterator()}
+            updated, created, removed = [], [], []
+            for key, n in changes.items():
+                if key not in existing:
+                    if n > 0:
+                        created.append(VoterRollup(count=n, **dict(zip(ROLLUP_KEY, key))))
+                    continue
+                pk, count = existing[key]
+                if count + n > 0:
+                    updated.append(VoterRollup(pk=pk, count=count + n))
+                else:
+                    removed.append(pk)
+
+            VoterRollup.objects.bulk_update(updated, ['count'], batch_size=1000)
+            VoterRollup.objects.bulk_create(created, batch_size=1000)
+            for i in range(0, len(removed), 1000):
+                VoterRollup.objects.filter(pk__in=removed[i:i + 1000]).delete()
+    return VoterRollup.objects.count()
@@ -0,0 +1,171 @@
+# voter_analytics/benchmarks.py
+# timing of the voter import and the voter_analytics pages, reported as JSON
+# so that runs can be compared across commits
+
+import itertools
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .cache import get_cache
+from .importer import import_voters
+from .models import Voter
+from .pagination import encode_cursor
+
+# filters applied to the graphs page, from none to every filter at once
+GRAPH_FILTERS = [
+    ('all voters', {}),
+    ('party', {'party': 'D '}),
+    ('birth years', {'min_year': '1950', 'max_year': '1980'}),
+    ('score', {'min_score': '3'}),
+    ('one election', {'elections': ['v22general']}),
+    ('all of two elections', {'elections': ['v20state', 'v21town'], 'match': 'all'}),
+    ('everything', {'party': 'U ', 'min_year': '1960', 'max_year': '1990', 'min_score': '2',
+                    'elections': ['v20state', 'v22general'], 'match': 'any'}),
+]
+
+# how far into the voter list the deep page starts, as a fraction of all voters
+DEEP_PAGE = 0.9
+
+
+def percentile(values, fraction):
+    '''Return the value at the given fraction of a list, by nearest rank.'''
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_commit():
+    '''Return the commit the code is running from, or None outside a git checkout.'''
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True, cwd=os.path.dirname(__file__))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def measure(function, runs, before=None):
+    '''Call function runs times and return its timings, query count and peak
+       memory.  before, if given, is called ahead of every run, untimed.
+       Peak memory comes from one extra traced run, so that tracing does not
+       slow down the timed ones.'''
+    timings = []
+    queries = 0
+    for i in range(runs):
+        if before:
+            before()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(captured)
+
+    if before:
+        before()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'runs': runs,
+        'queries': queries,
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'max_ms': round(max(timings), 2),
+        'peak_kb': round(peak / 1024),
+    }
+
+
+class Benchmark:
+    '''Times the voter_analytics pages through the Django test client, so that
+       URL routing, middleware and template rendering are included.'''
+
+    def __init__(self, runs=20):
+        self.runs = runs
+        self.client = Client()
+        self.results = []
+
+    def get(self, url, params=None):
+        '''Request a page and fail loudly if it does not render.'''
+        response = self.client.get(url, params or {})
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}')
+        return response
+
+    def add(self, name, function, before=None, runs=None, **details):
+        '''Measure one case and record its result.'''
+        result = {'name': name, **details}
+        result.update(measure(function, runs or self.runs, before))
+        self.results.append(result)
+        return result
+
+    def run_import(self, filename, workers):
+        '''Time a full replacing import of filename.  Run once, since it rewrites the table.'''
+        started = time.perf_counter()
+        tracemalloc.start()
+        try:
+            result = import_voters(filename, replace=True, workers=workers)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        elapsed = time.perf_counter() - started
+        self.results.append({
+            'name': 'import', 'filename': filename, 'workers': workers, 'runs': 1,
+            'rows': result.written, 'rejected': result.rejected,
+            'seconds': round(elapsed, 2), 'rows_per_second': round(result.written / elapsed),
+            # traced in this process only; worker processes are not included
+            'peak_kb': round(peak / 1024),
+        })
+
+    def run_pages(self):
+        '''Time the voter list, graphs and detail pages.'''
+        list_url = reverse('voters_list')
+        self.add('voter list, first page', lambda: self.get(list_url), url=list_url)
+
+        # the deep page and detail page need voters to point at
+        total = Voter.objects.count()
+        if total:
+            offset = int(total * DEEP_PAGE)
+            ordering = ['last_name', 'first_name', 'id']
+            deep = Voter.objects.order_by(*ordering).values_list(*ordering)[offset]
+            cursor = encode_cursor('next', list(deep))
+            self.add('voter list, deep page', lambda: self.get(list_url, {'cursor': cursor}),
+                     url=list_url, offset=offset)
+
+        graphs_url = reverse('graphs')
+        cache = get_cache()
+        for name, params in GRAPH_FILTERS:
+            self.add(f'graphs, {name}, cold cache', lambda: self.get(graphs_url, params),
+                     before=cache.clear, url=graphs_url, params=params)
+            self.add(f'graphs, {name}, warm cache', lambda: self.get(graphs_url, params),
+                     url=graphs_url, params=params)
+
+        if total:
+            pks = list(Voter.objects.order_by('?').values_list('pk', flat=True)[:self.runs + 1])
+            pending = itertools.cycle(pks)
+            self.add('voter detail', lambda: self.get(reverse('voter_detail', args=[next(pending)])),
+                     url=reverse('voter_detail', args=[pks[0]]))
+
+    def report(self):
+        '''Return the results with enough context to compare runs.'''
+        return {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'voters': Voter.objects.count(),
+            # peak resident set size of this process over the whole run
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'results': self.results,
+        }
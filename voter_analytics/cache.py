@@ -0,0 +1,103 @@
+# voter_analytics/cache.py
+# caching of computed voter analytics, invalidated by a data version that
+# every import bumps
+
+import hashlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db.models import Max
+from .models import VoterImport
+
+# cache alias holding the analytics; falls back to 'default' if not configured
+CACHE_ALIAS = getattr(settings, 'VOTER_ANALYTICS_CACHE', 'voter_analytics')
+
+# how long a process trusts the cached data version before re-reading it from
+# the database; bounds staleness when the cache backend is not shared
+VERSION_TIMEOUT = 60
+
+VERSION_KEY = 'voter_analytics:version'
+HITS_KEY = 'voter_analytics:hits'
+MISSES_KEY = 'voter_analytics:misses'
+
+
+def get_cache():
+    '''Return the cache backend used for voter analytics.'''
+    try:
+        return caches[CACHE_ALIAS]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def data_version():
+    '''Return the current data version: the id of the latest VoterImport.'''
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = VoterImport.objects.aggregate(latest=Max('id'))['latest'] or 0
+        cache.set(VERSION_KEY, version, VERSION_TIMEOUT)
+    return version
+
+
+def set_data_version(version):
+    '''Publish a new data version, making every older cache entry unreachable.'''
+    get_cache().set(VERSION_KEY, version, VERSION_TIMEOUT)
+
+
+def count(key):
+    '''Increment a hit/miss counter in the cache.'''
+    cache = get_cache()
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the counter was evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def cache_key(namespace, signature):
+    '''Return the cache key for signature under the current data version.'''
+    digest = hashlib.md5(repr(signature).encode('utf-8')).hexdigest()
+    return f'voter_analytics:{namespace}:{data_version()}:{digest}'
+
+
+def cached(namespace, signature, compute):
+    '''Return the value cached for signature under the current data version,
+       calling compute() and storing its result on a miss.'''
+    key = cache_key(namespace, signature)
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        count(HITS_KEY)
+        return value
+
+    count(MISSES_KEY)
+    value = compute()
+    cache.set(key, value, None)
+    return value
+
+
+async def acached(namespace, signature, compute):
+    '''Async form of cached(): compute is a coroutine function, awaited on a miss.'''
+    key = await sync_to_async(cache_key)(namespace, signature)
+    cache = get_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        await sync_to_async(count)(HITS_KEY)
+        return value
+
+    await sync_to_async(count)(MISSES_KEY)
+    value = await compute()
+    await cache.aset(key, value, None)
+    return value
+
+
+def cache_stats():
+    '''Return the hit and miss counters and the current data version.'''
+    cache = get_cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+        'version': data_version(),
+    }
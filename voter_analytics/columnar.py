@@ -0,0 +1,293 @@
+# voter_analytics/columnar.py
+# optional in-memory columnar copy of the voter table, filtered and
+# aggregated with NumPy instead of SQL, and saved as a memory-mapped
+# snapshot file that every worker process can share
+
+import json
+import os
+import re
+import threading
+from array import array
+from django.conf import settings
+from django.db.models.functions import ExtractYear
+from .models import ELECTIONS, ELECTION_BITS, Voter, election_mask
+from .cache import data_version
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the rollup backend is used instead
+    np = None
+
+# rows fetched per database round trip while loading
+LOAD_CHUNK_SIZE = 10000
+
+# the fixed-width columns of a snapshot file, in file order
+SNAPSHOT_COLUMNS = [
+    ('birth_year', 'int16'),
+    ('party', 'uint8'),
+    ('score', 'int8'),
+    ('participation', 'uint32'),
+    ('precinct', 'uint16'),
+]
+
+# each column starts on a multiple of this many bytes
+SNAPSHOT_ALIGNMENT = 64
+
+# snapshots kept on disk; older ones are deleted once a newer one is written,
+# while a process that still maps one keeps reading it until it moves on
+SNAPSHOT_KEEP = 2
+
+SNAPSHOT_NAME = re.compile(r'^voters-(\d+)\.(bin|json)$')
+
+
+def available():
+    '''True if NumPy is installed and the columnar backend can be used.'''
+    return np is not None
+
+
+class Categories:
+    '''Assigns small integer codes to the distinct values of a text column.'''
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def code(self, value):
+        '''return the code for value, adding it if new.'''
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.labels)
+            self.labels.append(value)
+        return code
+
+
+class VoterColumns:
+    '''The columns of Voter needed by the graphs, one NumPy array per column:
+       birth year (int16), party code (uint8), voter score (int8),
+       participation bitmask (uint32) and precinct code (uint16).'''
+
+    def __init__(self, birth_year, party, score, participation, precinct,
+                 party_labels, precinct_labels, version=None):
+        self.birth_year = birth_year
+        self.party = party
+        self.score = score
+        self.participation = participation
+        self.precinct = precinct
+        self.party_labels = party_labels
+        self.precinct_labels = precinct_labels
+        self.version = version
+
+    def __len__(self):
+        return len(self.birth_year)
+
+    @classmethod
+    def load(cls, version=None):
+        '''Read the voter table into arrays with one streaming query.'''
+        parties = Categories()
+        precincts = Categories()
+        birth_year, party, score = array('h'), array('B'), array('b')
+        participation, precinct = array('I'), array('H')
+
+        rows = (Voter.objects.order_by()
+                .values_list(ExtractYear('doB'), 'party_affiliation', 'voter_score',
+                             'participation', 'precinct_num')
+                .iterator(chunk_size=LOAD_CHUNK_SIZE))
+        for year, party_name, voter_score, mask, precinct_num in rows:
+            birth_year.append(year)
+            party.append(parties.code(party_name))
+            score.append(voter_score)
+            participation.append(mask)
+            precinct.append(precincts.code(precinct_num))
+
+        return cls(
+            np.frombuffer(birth_year, dtype=np.int16),
+            np.frombuffer(party, dtype=np.uint8),
+            np.frombuffer(score, dtype=np.int8),
+            np.frombuffer(participation, dtype=np.uint32),
+            np.frombuffer(precinct, dtype=np.uint16),
+            parties.labels, precincts.labels, version,
+        )
+
+    def save(self, version):
+        '''Write these columns as the snapshot for version: a data file holding
+           each column as a raw aligned array, and a JSON file describing it.
+           Both are written under temporary names and renamed into place, the
+           description last, so readers never see a partial snapshot.'''
+        data_path, info_path = snapshot_paths(version)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+        columns = {}
+        with open(data_path + '.tmp', 'wb') as f:
+            for name, dtype in SNAPSHOT_COLUMNS:
+                f.write(b'\0' * (-f.tell() % SNAPSHOT_ALIGNMENT))
+                columns[name] = {'dtype': dtype, 'offset': f.tell()}
+                f.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+        os.replace(data_path + '.tmp', data_path)
+
+        info = {
+            'version': version,
+            'rows': len(self),
+            'columns': columns,
+            'party_labels': self.party_labels,
+            'precinct_labels': self.precinct_labels,
+        }
+        with open(info_path + '.tmp', 'w') as f:
+            json.dump(info, f)
+        os.replace(info_path + '.tmp', info_path)
+
+    @classmethod
+    def open(cls, version):
+        '''Map the snapshot for version read-only, or return None if there is
+           none.  The pages are shared with every other process mapping the
+           same file, so nothing is copied into this process.'''
+        data_path, info_path = snapshot_paths(version)
+        try:
+            with open(info_path) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        rows = info['rows']
+        arrays = {}
+        for name, dtype in SNAPSHOT_COLUMNS:
+            column = info['columns'][name]
+            if rows:
+                arrays[name] = np.memmap(data_path, dtype=column['dtype'], mode='r',
+                                         offset=column['offset'], shape=(rows,))
+            else:
+                # an empty file region cannot be mapped
+                arrays[name] = np.empty(0, dtype=column['dtype'])
+
+        return cls(**arrays, party_labels=info['party_labels'],
+                   precinct_labels=info['precinct_labels'], version=version)
+
+    def mask(self, voter_filter):
+        '''Return a boolean array selecting the voters matched by a VoterFilter.'''
+        selected = np.ones(len(self), dtype=bool)
+        if voter_filter.party:
+            if voter_filter.party in self.party_labels:
+                selected &= self.party == self.party_labels.index(voter_filter.party)
+            else:
+                selected[:] = False
+        if voter_filter.min_year is not None:
+            selected &= self.birth_year >= voter_filter.min_year
+        if voter_filter.max_year is not None:
+            selected &= self.birth_year <= voter_filter.max_year
+        if voter_filter.min_score is not None:
+            selected &= self.score >= voter_filter.min_score
+
+        bits = election_mask(voter_filter.elections)
+        if bits:
+            hit = self.participation & bits
+            selected &= (hit == bits) if voter_filter.match == 'all' else (hit != 0)
+        return selected
+
+    def chart_data(self, voter_filter):
+        '''Compute ChartData for a VoterFilter with vectorized counts.'''
+        from .aggregates import ChartData
+
+        selected = self.mask(voter_filter)
+        years = self.birth_year[selected]
+        parties = self.party[selected]
+        participation = self.participation[selected]
+
+        years_out, year_counts = [], []
+        if len(years):
+            low = int(years.min())
+            counts = np.bincount(years - low)
+            nonzero = np.flatnonzero(counts)
+            years_out = (nonzero + low).tolist()
+            year_counts = counts[nonzero].tolist()
+
+        party_counts = np.bincount(parties, minlength=len(self.party_labels))
+        present = sorted((self.party_labels[i], int(n)) for i, n in enumerate(party_counts) if n)
+
+        votes = [int(np.count_nonzero(participation & ELECTION_BITS[name])) for name, label in ELECTIONS]
+
+        return ChartData(years_out, year_counts,
+                         [p for p, n in present], [n for p, n in present], votes)
+
+
+def snapshot_paths(version):
+    '''Return the data and description paths of the snapshot for version.'''
+    base = os.path.join(settings.VOTER_ANALYTICS_SNAPSHOT_DIR, f'voters-{version}')
+    return base + '.bin', base + '.json'
+
+
+def prune_snapshots(current, keep=SNAPSHOT_KEEP):
+    '''Delete all but the keep most recently written snapshots, never
+       deleting the one for the current version.  Age is taken from the file
+       times, not the version numbers, which start again after a database
+       reset while old files may still be in the directory.'''
+    directory = settings.VOTER_ANALYTICS_SNAPSHOT_DIR
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    found = [(int(m.group(1)), name) for name in names if (m := SNAPSHOT_NAME.match(name))]
+    written = {}
+    for version, name in found:
+        try:
+            mtime = os.path.getmtime(os.path.join(directory, name))
+        except OSError:
+            continue
+        written[version] = max(written.get(version, 0), mtime)
+    others = sorted((v for v in written if v != current), key=written.get, reverse=True)
+    kept = {current, *others[:keep - 1]}
+    for version, name in found:
+        if version not in kept:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def write_snapshot(version):
+    '''Read the voter table and save it as the snapshot for version; called by
+       the importer.  Returns the columns, or None when NumPy is missing.'''
+    if not available():
+        return None
+    columns = VoterColumns.load(version)
+    columns.save(version)
+    prune_snapshots(version)
+    return columns
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def open_columns(version):
+    '''Map the snapshot for version, writing it first if no process has yet.
+       Falls back to an in-memory copy when the snapshot directory cannot be
+       written.'''
+    columns = VoterColumns.open(version)
+    if columns is None:
+        try:
+            write_snapshot(version)
+            columns = VoterColumns.open(version)
+        except OSError:
+            columns = None
+    if columns is None:
+        # another process may have pruned or replaced the file meanwhile
+        columns = VoterColumns.load(version)
+    return columns
+
+
+def get_columns():
+    '''Return the VoterColumns for the current data version, mapping its
+       snapshot file the first time each version is asked for.'''
+    global _snapshot
+    version = data_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = open_columns(version)
+            snapshot = _snapshot
+    return snapshot
+
+
+def chart_data(voter_filter):
+    '''Compute ChartData for a VoterFilter from the in-memory snapshot.'''
+    return get_columns().chart_data(voter_filter)
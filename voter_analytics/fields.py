@@ -0,0 +1,35 @@
+# voter_analytics/fields.py
+# custom model fields and lookups for voter data
+
+from django.db import models
+
+
+class ParticipationField(models.PositiveIntegerField):
+    '''Election participation history packed into an integer, one bit per
+       election (see ELECTIONS in models.py).  Supports the lookups
+       hasany (voted in at least one of the elections in a mask) and
+       hasall (voted in every election in a mask).'''
+
+
+@ParticipationField.register_lookup
+class HasAny(models.Lookup):
+    '''field__hasany=mask: at least one bit of mask is set.'''
+
+    lookup_name = 'hasany'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) != 0', [*lhs_params, *rhs_params]
+
+
+@ParticipationField.register_lookup
+class HasAll(models.Lookup):
+    '''field__hasall=mask: every bit of mask is set.'''
+
+    lookup_name = 'hasall'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) = {rhs}', [*lhs_params, *rhs_params, *rhs_params]
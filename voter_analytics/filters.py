@@ -0,0 +1,104 @@
+# voter_analytics/filters.py
+# shared compiler from voter search parameters to database filters
+
+from datetime import date
+from django.db.models import Q
+from .models import ELECTION_BITS, election_mask
+
+
+def parse_int(value):
+    '''Return value as an int, or None if it is missing or not a number.'''
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_year(value):
+    '''Return value as a year usable in a date, or None.'''
+    year = parse_int(value)
+    if year is None or not 1 <= year < 9999:
+        return None
+    return year
+
+
+class VoterFilter:
+    '''The party, birth year, voter score and election filters used by the
+       voter list and the graphs, parsed and normalized once.
+
+       Birth years are compiled into a range on the doB column itself rather
+       than doB__year, so that indexes on doB can serve the query.'''
+
+    def __init__(self, party=None, min_year=None, max_year=None, min_score=None,
+                 elections=(), match='any'):
+        self.party = party or None
+        self.min_year = min_year
+        self.max_year = max_year
+        self.min_score = min_score
+        self.elections = sorted(set(e for e in elections if e in ELECTION_BITS))
+        self.match = 'all' if match == 'all' else 'any'
+
+    @classmethod
+    def from_querydict(cls, params):
+        '''Build a filter from GET parameters; invalid values are ignored.'''
+        return cls(
+            party=params.get('party'),
+            min_year=parse_year(params.get('min_year')),
+            max_year=parse_year(params.get('max_year')),
+            min_score=parse_int(params.get('min_score')),
+            elections=params.getlist('elections'),
+            match=params.get('match'),
+        )
+
+    def signature(self):
+        '''Return a normalized, hashable form of this filter, equal for all
+           requests that select the same voters.'''
+        # 'any' and 'all' only differ when more than one election is chosen
+        match = self.match if len(self.elections) > 1 else 'any'
+        return (self.party, self.min_year, self.max_year, self.min_score,
+                tuple(self.elections), match)
+
+    def participation_q(self):
+        '''Q testing the participation bitmask against the chosen elections.'''
+        mask = election_mask(self.elections)
+        if not mask:
+            return Q()
+        if self.match == 'all':
+            return Q(participation__hasall=mask)
+        return Q(participation__hasany=mask)
+
+    def voter_q(self):
+        '''Q selecting the matching rows of Voter.'''
+        q = Q()
+        if self.party:
+            q &= Q(party_affiliation=self.party)
+        if self.min_year is not None:
+            q &= Q(doB__gte=date(self.min_year, 1, 1))
+        if self.max_year is not None:
+            q &= Q(doB__lt=date(self.max_year + 1, 1, 1))
+        if self.min_score is not None:
+            q &= Q(voter_score__gte=self.min_score)
+        return q & self.participation_q()
+
+    def rollup_q(self):
+        '''Q selecting the matching groups of VoterRollup.'''
+        q = Q()
+        if self.party:
+            q &= Q(party_affiliation=self.party)
+        if self.min_year is not None:
+            q &= Q(birth_year__gte=self.min_year)
+        if self.max_year is not None:
+            q &= Q(birth_year__lte=self.max_year)
+        if self.min_score is not None:
+            q &= Q(voter_score__gte=self.min_score)
+        return q & self.participation_q()
+
+
+class VoterFilterMixin:
+    '''adds the parsed VoterFilter for the current request to a view'''
+
+    def get_voter_filter(self):
+        '''parse the GET parameters once per request.'''
+        if not hasattr(self, '_voter_filter'):
+            self._voter_filter = VoterFilter.from_querydict(self.request.GET)
+        return self._voter_filter
@@ -0,0 +1,300 @@
+# voter_analytics/importer.py
+# bulk loading of voter records from CSV files into the database
+
+import csv
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from django.db import transaction
+from .models import Voter, VoterImport, VoterRollup
+from .aggregates import apply_rollup_delta, rebuild_rollups, rollup_key, stored_rollup_counts
+from .cache import set_data_version
+from .columnar import write_snapshot
+from .search import rebuild_search_index, update_search_index
+from .parsing import VOTER_FIELDS, MAX_ERRORS, parse_row, chunk_ranges, parse_chunk
+
+# number of rows sent to the database in one INSERT statement
+BATCH_SIZE = 1000
+
+# number of rows buffered and written together; each chunk is its own
+# transaction in sync_voters and a savepoint inside the import in import_voters
+TRANSACTION_SIZE = 20000
+
+# fields rewritten when an existing voter is upserted
+UPSERT_FIELDS = [f for f in VOTER_FIELDS if f != 'voter_id']
+
+
+def build_voter(row):
+    '''Create an unsaved Voter from a tuple produced by parse_row().'''
+    return Voter(**dict(zip(VOTER_FIELDS, row)))
+
+
+def read_records(filename):
+    '''Yield (line_number, fields) for every data record in a voter CSV file.'''
+    with open(filename, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # skip the header
+        for fields in reader:
+            if fields:
+                yield reader.line_num, fields
+
+
+class ImportResult:
+    '''Counters collected while importing a voter file.'''
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.rejected = 0
+        self.errors = []
+        self.total = 0
+        self.rollups = 0
+        self.workers = {}  # pid -> [rows parsed, seconds spent parsing]
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, where, error):
+        '''record a row that could not be imported.'''
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f'{where}: {error}')
+
+    def add_chunk(self, rows, rejected, errors, pid, seconds):
+        '''record the outcome of one chunk parsed by a worker process.'''
+        self.rejected += rejected
+        self.errors.extend(errors[:MAX_ERRORS - len(self.errors)])
+        stats = self.workers.setdefault(pid, [0, 0.0])
+        stats[0] += len(rows)
+        stats[1] += seconds
+
+    @property
+    def written(self):
+        '''rows inserted or updated so far.'''
+        return self.created + self.updated
+
+    def finish(self, filename, mode, incremental=False):
+        '''refresh the rollups and search index, stop the clock, take the final row count and
+           record the import, which bumps the data version and gets its own columnar snapshot
+           once the import is committed.  With incremental, the rollups and search index were
+           already kept up to date row by row.  An import that changed nothing leaves
+           everything, including the data version and cached charts, as it was.'''
+        changed = self.created or self.updated or self.deleted
+        if changed and not incremental:
+            self.rollups = rebuild_rollups()
+            rebuild_search_index()
+        else:
+            self.rollups = VoterRollup.objects.count()
+        self.elapsed = time.perf_counter() - self.started
+        self.total = Voter.objects.count()
+        if not changed:
+            return
+
+        record = VoterImport.objects.create(
+            filename=filename, mode=mode,
+            created=self.created, updated=self.updated, deleted=self.deleted,
+            rejected=self.rejected, total=self.total, elapsed=self.elapsed,
+        )
+        transaction.on_commit(lambda: publish(record.pk))
+
+    @property
+    def rows_per_second(self):
+        '''rows written per second of wall-clock time.'''
+        elapsed = self.elapsed or time.perf_counter() - self.started
+        if not elapsed:
+            return 0.0
+        return self.written / elapsed
+
+    def worker_throughput(self):
+        '''return (pid, rows, rows per second of parse time) for each worker.'''
+        return [(pid, rows, rows / seconds if seconds else 0.0)
+                for pid, (rows, seconds) in sorted(self.workers.items())]
+
+
+def publish(version):
+    '''Write the columnar snapshot of a committed import and make it the
+       current data version.'''
+    write_snapshot(version)
+    set_data_version(version)
+
+
+def parse_serial(filename, result):
+    '''Yield parsed rows from a voter file using the current process.'''
+    for line_num, fields in read_records(filename):
+        try:
+            yield parse_row(fields)
+        except (ValueError, IndexError) as e:
+            result.reject(f'line {line_num}', e)
+
+
+def parse_parallel(filename, result, workers):
+    '''Yield parsed rows from a voter file, parsing byte-range chunks in a pool
+       of worker processes.  Chunks are yielded in file order and at most two
+       chunks per worker are in flight, so memory stays bounded when the
+       database writer is the slower side.'''
+    ranges = deque(chunk_ranges(filename))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while ranges or pending:
+            while ranges and len(pending) < workers * 2:
+                start, end = ranges.popleft()
+                pending.append(pool.submit(parse_chunk, filename, start, end))
+
+            rows, rejected, errors, pid, seconds = pending.popleft().result()
+            result.add_chunk(rows, rejected, errors, pid, seconds)
+            yield from rows
+
+
+def write_voters(voters, batch_size=BATCH_SIZE, upsert=False):
+    '''Insert a list of unsaved Voters with batched INSERTs in one transaction.
+       With upsert, rows whose voter_id already exists are updated in place.'''
+    with transaction.atomic():
+        if upsert:
+            Voter.objects.bulk_create(voters, batch_size=batch_size, update_conflicts=True,
+                                      unique_fields=['voter_id'], update_fields=UPSERT_FIELDS)
+        else:
+            Voter.objects.bulk_create(voters, batch_size=batch_size)
+    return len(voters)
+
+
+def delete_voters(voter_ids, batch_size=BATCH_SIZE):
+    '''Delete the voters with the given voter IDs, batch_size at a time,
+       taking them out of the rollups and search index.'''
+    deleted = 0
+    with transaction.atomic():
+        delta = Counter()
+        delta.subtract(stored_rollup_counts(voter_ids, batch_size))
+        update_search_index(voter_ids, remove=True, batch_size=batch_size)
+        for i in range(0, len(voter_ids), batch_size):
+            batch = voter_ids[i:i + batch_size]
+            deleted += Voter.objects.filter(voter_id__in=batch).delete()[0]
+        apply_rollup_delta(delta)
+    return deleted
+
+
+def upsert_voters(voters, changed_ids, batch_size=BATCH_SIZE):
+    '''Upsert a chunk of voters in one transaction, moving them between
+       rollup groups and re-indexing them.  changed_ids are the voter IDs of
+       the voters that are already stored.'''
+    with transaction.atomic():
+        delta = Counter()
+        delta.subtract(stored_rollup_counts(changed_ids, batch_size))
+        update_search_index(changed_ids, remove=True, batch_size=batch_size)
+        write_voters(voters, batch_size, upsert=True)
+        delta.update(rollup_key(voter) for voter in voters)
+        update_search_index([voter.voter_id for voter in voters], batch_size=batch_size)
+        apply_rollup_delta(delta)
+    return len(voters)
+
+
+def parse_rows(filename, result, workers):
+    '''Yield parsed rows from a voter file, in parallel when workers > 1.'''
+    if workers > 1:
+        return parse_parallel(filename, result, workers)
+    return parse_serial(filename, result)
+
+
+def import_voters(filename, batch_size=BATCH_SIZE, transaction_size=TRANSACTION_SIZE,
+                  replace=False, workers=1, progress=None):
+    '''Stream a voter CSV file into the database.
+
+       Rows are parsed in this process, or by a pool of worker processes when
+       workers > 1, and written by this process in chunks of transaction_size
+       using INSERTs of batch_size rows.  The whole import, including the
+       delete done by replace, is one transaction, so a failure part way
+       through leaves the stored voters as they were.  Rows repeating a voter
+       ID already in the file, or already stored when appending, are rejected.
+       progress is called with the ImportResult after every chunk.'''
+    result = ImportResult()
+
+    with transaction.atomic():
+        if replace:
+            result.deleted = Voter.objects.all().delete()[0]
+            seen = set()
+        else:
+            seen = set(Voter.objects.exclude(voter_id=None)
+                       .values_list('voter_id', flat=True).iterator(chunk_size=10000))
+
+        pending = []
+        for row in parse_rows(filename, result, workers):
+            voter_id = row[-2]
+            if voter_id is not None:
+                if voter_id in seen:
+                    result.reject(f'voter {voter_id}', 'duplicate voter ID')
+                    continue
+                seen.add(voter_id)
+            pending.append(build_voter(row))
+
+            if len(pending) >= transaction_size:
+                result.created += write_voters(pending, batch_size)
+                pending = []
+                if progress:
+                    progress(result)
+
+        if pending:
+            result.created += write_voters(pending, batch_size)
+
+        result.finish(filename, 'replace' if replace else 'append')
+    return result
+
+
+def sync_voters(filename, batch_size=BATCH_SIZE, transaction_size=TRANSACTION_SIZE,
+                workers=1, progress=None):
+    '''Re-import a voter file as a diff against the stored voters.
+
+       Rows are matched on voter_id. New voters are inserted, voters whose
+       row_hash changed are upserted, and stored voters missing from the file
+       are deleted, so the cost follows the size of the change rather than the
+       size of the file: the rollups and search index are adjusted for the
+       changed rows only. Voters loaded without a voter ID cannot be matched
+       and are removed.  The whole sync is one transaction, so a failure part
+       way through leaves the stored voters as they were.'''
+    result = ImportResult()
+
+    with transaction.atomic():
+        stored = dict(Voter.objects.exclude(voter_id=None).values_list('voter_id', 'row_hash')
+                      .iterator(chunk_size=10000))
+        seen = set()
+
+        pending, changed = [], []
+        for row in parse_rows(filename, result, workers):
+            voter_id, digest = row[-2], row[-1]
+            if voter_id is None:
+                result.reject(f'voter {row[1]} {row[0]}', 'missing voter ID')
+                continue
+            if voter_id in seen:
+                result.reject(f'voter {voter_id}', 'duplicate voter ID')
+                continue
+            seen.add(voter_id)
+
+            old_hash = stored.pop(voter_id, None)
+            if old_hash is None:
+                result.created += 1
+            elif old_hash != digest:
+                result.updated += 1
+                changed.append(voter_id)
+            else:
+                result.unchanged += 1
+                continue
+
+            pending.append(build_voter(row))
+            if len(pending) >= transaction_size:
+                upsert_voters(pending, changed, batch_size)
+                pending, changed = [], []
+                if progress:
+                    progress(result)
+
+        if pending:
+            upsert_voters(pending, changed, batch_size)
+
+        # whatever was not seen in the file has left the roll
+        if stored:
+            result.deleted += delete_voters(list(stored), batch_size)
+
+        # rows without an ID are not in any delta, so removing them means a full rebuild
+        unmatched = Voter.objects.filter(voter_id__isnull=True).delete()[0]
+        result.deleted += unmatched
+
+        result.finish(filename, 'upsert', incremental=not unmatched)
+    return result
@@ -0,0 +1,62 @@
+# voter_analytics/management/commands/benchmark_voters.py
+# manage.py command to time the voter import and pages and report JSON
+
+import json
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from voter_analytics.benchmarks import Benchmark
+from voter_analytics.synthetic import write_voter_file
+
+
+class Command(BaseCommand):
+    '''Time the voter import, voter list, graphs and detail pages, and print
+       query counts, p50/p95 latency and peak memory as JSON.'''
+
+    help = ('Time the voter import and the voter_analytics pages and report query counts, '
+            'p50/p95 latency and peak memory as JSON. Replaces the stored voters when '
+            '--rows or --file is given.')
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument('--rows', type=int,
+                            help='generate and import a synthetic file of this many voters first')
+        source.add_argument('--file', help='import this voter CSV file first')
+        parser.add_argument('--seed', type=int, default=412,
+                            help='random seed for --rows')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='number of processes parsing the file during the import')
+        parser.add_argument('--runs', type=int, default=20,
+                            help='timed requests per page')
+        parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        '''run the benchmarks and write the report.'''
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+        benchmark = Benchmark(runs=options['runs'])
+
+        if options['rows']:
+            with tempfile.TemporaryDirectory() as directory:
+                filename = os.path.join(directory, 'voters.csv')
+                self.stderr.write(f'Generating {options["rows"]} voters...')
+                write_voter_file(filename, options['rows'], seed=options['seed'])
+                self.stderr.write('Importing...')
+                benchmark.run_import(filename, options['workers'])
+        elif options['file']:
+            self.stderr.write(f'Importing {options["file"]}...')
+            try:
+                benchmark.run_import(options['file'], options['workers'])
+            except OSError as e:
+                raise CommandError(f'Could not read {options["file"]}: {e}')
+
+        self.stderr.write('Timing pages...')
+        benchmark.run_pages()
+
+        report = json.dumps(benchmark.report(), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Done. Report written to {options["output"]}.'))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,59 @@
+# voter_analytics/management/commands/explain_voter_filters.py
+# manage.py command to print the query plans behind each voter filter combination
+
+from itertools import combinations
+from django.core.management.base import BaseCommand
+from voter_analytics.filters import VoterFilter
+from voter_analytics.models import Voter
+
+# a sample value for every filter parameter
+SAMPLE_FILTERS = {
+    'party': 'D ',
+    'min_year': 1960,
+    'max_year': 1990,
+    'min_score': 3,
+    'elections': ['v20state', 'v22general'],
+}
+
+
+class Command(BaseCommand):
+    '''Print the query plan of the voter list for every combination of filters.'''
+
+    help = 'Print the query plan of the voter list for every combination of filters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', action='store_true',
+                            help='explain the query for the full result set instead of the first page')
+
+    def handle(self, *args, **options):
+        '''explain each combination and flag plans that scan the whole table.'''
+        full_scans = 0
+        names = list(SAMPLE_FILTERS)
+
+        for size in range(len(names) + 1):
+            for combo in combinations(names, size):
+                voter_filter = VoterFilter(**{name: SAMPLE_FILTERS[name] for name in combo})
+                qs = Voter.objects.filter(voter_filter.voter_q())
+                if options['count']:
+                    plan = qs.order_by().values('pk').explain()
+                else:
+                    plan = qs.order_by('last_name', 'first_name', 'id')[:101].explain()
+
+                scan = self.is_full_scan(plan)
+                full_scans += scan
+                label = ', '.join(combo) or '(no filters)'
+                self.stdout.write(self.style.WARNING(f'{label}  [FULL SCAN]') if scan else label)
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        self.stdout.write(f'{full_scans} filter combinations fall back to a full table scan.')
+
+    def is_full_scan(self, plan):
+        '''True if the plan reads the voter table without any index.'''
+        if 'Seq Scan on voter_analytics_voter' in plan:  # PostgreSQL
+            return True
+        for line in plan.splitlines():
+            words = line.split()
+            if 'SCAN' in words and 'USING' not in words and any('voter_analytics_voter' in w for w in words):
+                return True
+        return False
@@ -0,0 +1,34 @@
+# voter_analytics/management/commands/generate_voters.py
+# manage.py command to write a synthetic voter CSV file for benchmarking
+
+from django.core.management.base import BaseCommand, CommandError
+from voter_analytics.synthetic import write_voter_file
+
+
+class Command(BaseCommand):
+    '''Write a synthetic voter CSV file in the layout read by import_voters.'''
+
+    help = 'Write a synthetic voter CSV file in the layout read by import_voters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename', help='CSV file to write')
+        parser.add_argument('--rows', type=int, default=100000,
+                            help='number of voters to generate')
+        parser.add_argument('--seed', type=int, default=412,
+                            help='random seed; the same seed and size give the same file')
+
+    def handle(self, *args, **options):
+        '''generate the file and report its size.'''
+        if options['rows'] < 1:
+            raise CommandError('--rows must be at least 1')
+        try:
+            count = write_voter_file(options['filename'], options['rows'], seed=options['seed'],
+                                     progress=self.report_progress)
+        except OSError as e:
+            raise CommandError(f'Could not write {options["filename"]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. Wrote {count} voters to {options["filename"]}.'))
+
+    def report_progress(self, written):
+        '''print a running total while generating.'''
+        self.stdout.write(f'  {written} voters written')
@@ -0,0 +1,63 @@
+# voter_analytics/management/commands/import_voters.py
+# manage.py command to bulk load a voter CSV file
+
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from voter_analytics import importer
+
+
+class Command(BaseCommand):
+    '''Import voter records from a CSV file using batched inserts.'''
+
+    help = 'Import voter records from a CSV file using batched inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename', nargs='?', default='data/newton_voters.csv',
+                            help='voter CSV file to import')
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE,
+                            help='rows per INSERT statement')
+        parser.add_argument('--transaction-size', type=int, default=importer.TRANSACTION_SIZE,
+                            help='rows written per transaction')
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--replace', action='store_true',
+                          help='delete all existing voters before importing')
+        mode.add_argument('--upsert', action='store_true',
+                          help='apply only the differences against stored voters, keyed on voter ID')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='number of processes parsing the file (1 parses in-process)')
+
+    def handle(self, *args, **options):
+        '''run the import and report its throughput.'''
+        kwargs = {
+            'batch_size': options['batch_size'],
+            'transaction_size': options['transaction_size'],
+            'workers': options['workers'],
+            'progress': self.report_progress,
+        }
+        try:
+            if options['upsert']:
+                result = importer.sync_voters(options['filename'], **kwargs)
+            else:
+                result = importer.import_voters(options['filename'], replace=options['replace'], **kwargs)
+        except OSError as e:
+            raise CommandError(f'Could not read {options["filename"]}: {e}')
+        except DatabaseError as e:
+            raise CommandError(f'Import of {options["filename"]} failed and was rolled back: {e}')
+
+        for pid, rows, rate in result.worker_throughput():
+            self.stdout.write(f'  worker {pid}: parsed {rows} rows ({rate:.0f} rows/s)')
+
+        for error in result.errors:
+            self.stderr.write(f'Rejected {error}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. Created {result.created}, updated {result.updated}, deleted {result.deleted} '
+            f'and left {result.unchanged} voters unchanged in {result.elapsed:.1f}s '
+            f'({result.rows_per_second:.0f} rows/s), rejected {result.rejected} rows. '
+            f'Table now holds {result.total} voters in {result.rollups} rollup groups.'
+        ))
+
+    def report_progress(self, result):
+        '''print a running total after each transaction.'''
+        self.stdout.write(f'  {result.written} rows written ({result.rows_per_second:.0f} rows/s)')
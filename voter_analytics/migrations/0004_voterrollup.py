@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:25
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+
+
+GROUP_FIELDS = ['party_affiliation', 'voter_score', 'precinct_num',
+                'v20state', 'v21town', 'v21primary', 'v22general', 'v23town']
+
+
+def build_rollups(apps, schema_editor):
+    '''Fill the rollup table from the voters already in the database.'''
+    Voter = apps.get_model('voter_analytics', 'Voter')
+    VoterRollup = apps.get_model('voter_analytics', 'VoterRollup')
+    groups = (Voter.objects.order_by()
+              .values(*GROUP_FIELDS, birth_year=ExtractYear('doB'))
+              .annotate(count=Count('id')))
+    VoterRollup.objects.bulk_create((VoterRollup(**group) for group in groups), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0003_voter_voter_id_row_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('party_affiliation', models.CharField(max_length=2)),
+                ('birth_year', models.IntegerField()),
+                ('voter_score', models.IntegerField()),
+                ('precinct_num', models.CharField(max_length=10)),
+                ('v20state', models.BooleanField(default=False)),
+                ('v21town', models.BooleanField(default=False)),
+                ('v21primary', models.BooleanField(default=False)),
+                ('v22general', models.BooleanField(default=False)),
+                ('v23town', models.BooleanField(default=False)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+import voter_analytics.fields
+from django.db import migrations
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import ExtractYear
+
+
+# the participation flags in bit order
+FLAGS = ['v20state', 'v21town', 'v21primary', 'v22general', 'v23town']
+
+
+def backfill_participation(apps, schema_editor):
+    '''Pack the participation flags of every voter into the bitmask with one UPDATE,
+       then rebuild the rollups grouped on the bitmask.'''
+    Voter = apps.get_model('voter_analytics', 'Voter')
+    VoterRollup = apps.get_model('voter_analytics', 'VoterRollup')
+
+    bits = [Case(When(**{flag: True}, then=Value(1 << i)), default=Value(0), output_field=IntegerField())
+            for i, flag in enumerate(FLAGS)]
+    Voter.objects.update(participation=sum(bits[1:], bits[0]))
+
+    VoterRollup.objects.all().delete()
+    groups = (Voter.objects.order_by()
+              .values('party_affiliation', 'voter_score', 'precinct_num', 'participation',
+                      birth_year=ExtractYear('doB'))
+              .annotate(count=Count('id')))
+    VoterRollup.objects.bulk_create((VoterRollup(**group) for group in groups), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0004_voterrollup'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='voterrollup',
+            name='v20state',
+        ),
+        migrations.RemoveField(
+            model_name='voterrollup',
+            name='v21primary',
+        ),
+        migrations.RemoveField(
+            model_name='voterrollup',
+            name='v21town',
+        ),
+        migrations.RemoveField(
+            model_name='voterrollup',
+            name='v22general',
+        ),
+        migrations.RemoveField(
+            model_name='voterrollup',
+            name='v23town',
+        ),
+        migrations.AddField(
+            model_name='voter',
+            name='participation',
+            field=voter_analytics.fields.ParticipationField(default=0),
+        ),
+        migrations.AddField(
+            model_name='voterrollup',
+            name='participation',
+            field=voter_analytics.fields.ParticipationField(default=0),
+        ),
+        migrations.RunPython(backfill_participation, migrations.RunPython.noop),
+    ]
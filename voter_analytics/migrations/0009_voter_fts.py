@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations
+
+
+# the SQL of voter_analytics/search.py when this migration was written
+FTS_TABLE = 'voter_analytics_voter_fts'
+
+CREATE_SQL = [
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        last_name, first_name, st_number, st_name, zip_code,
+        content='voter_analytics_voter', content_rowid='id', prefix='2 3 4')''',
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS voter_analytics_voter_fts_vocab USING fts5vocab({FTS_TABLE}, 'row')",
+]
+
+DROP_SQL = [
+    'DROP TABLE IF EXISTS voter_analytics_voter_fts_vocab',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_fts(apps, schema_editor):
+    '''Create and fill the FTS5 index on SQLite; other databases use the fallback search.'''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0008_voterimport'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
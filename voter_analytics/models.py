@@ -1,15 +1,35 @@
 # voter_analytics/models.py
 # Amy Ho, aho@bu.edu
 from django.db import models
-from datetime import datetime
-import csv
+from .fields import ParticipationField
 
 # Create your models here.
 
+# elections tracked in the participation bitmask, with their display names.
+# the election at position i is bit (1 << i); append new elections to the end.
+ELECTIONS = [
+    ('v20state', '2020 State'),
+    ('v21town', '2021 Town'),
+    ('v21primary', '2021 Primary'),
+    ('v22general', '2022 General'),
+    ('v23town', '2023 Town'),
+]
+
+ELECTION_BITS = {name: 1 << i for i, (name, label) in enumerate(ELECTIONS)}
+
+def election_mask(names):
+    '''Return the participation bitmask for a collection of election names.
+       Unknown names are ignored.'''
+    mask = 0
+    for name in names:
+        mask |= ELECTION_BITS.get(name, 0)
+    return mask
+
 class Voter(models.Model):
     '''Represents a registered voter.'''
 
     # identification
+    voter_id = models.CharField(max_length=20, unique=True, blank=True, null=True)
     last_name = models.TextField()
     first_name = models.TextField()
 
@@ -33,51 +53,79 @@ class Voter(models.Model):
     v21primary = models.BooleanField(default=False)
     v22general = models.BooleanField(default=False)
     v23town = models.BooleanField(default=False)
+
+    # all of the above packed into one bitmask, one bit per entry in ELECTIONS
+    participation = ParticipationField(default=0)
     
     # Calculated field
     voter_score = models.IntegerField(default=0)
+
+    # digest of the source CSV record, compared on re-import
+    row_hash = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        indexes = [
+            # serves the keyset pagination of the voter list
+            models.Index(fields=['last_name', 'first_name', 'id'], name='voter_name_order_idx'),
+            # serve the search filters (see filters.VoterFilter)
+            models.Index(fields=['party_affiliation', 'doB'], name='voter_party_dob_idx'),
+            models.Index(fields=['party_affiliation', 'voter_score'], name='voter_party_score_idx'),
+            models.Index(fields=['voter_score', 'doB'], name='voter_score_dob_idx'),
+            models.Index(fields=['doB'], name='voter_dob_idx'),
+        ]
  
     def __str__(self):
         '''Return a string representation of this model instance.'''
         return f'{self.first_name} {self.last_name} ({self.party_affiliation}, {self.doB}), {self.zip_code}'
 
-def load_data():
-    '''Function to load data records from CSSV file into the Django database.'''
-
-    filename = 'data/newton_voters.csv'
-    f = open(filename)
-    f.readline()
-
-    # read several rows
-    for line in f:
-        fields = line.strip().split(',')
-
-        try:
-            # create a new instance of Voter object with this record from csv
-            voter = Voter(
-                last_name=fields[1],
-                first_name=fields[2],
-                st_number=fields[3],
-                st_name=fields[4],
-                apt_num=fields[5] or None,
-                zip_code=fields[6],
-                doB=datetime.strptime(fields[7], '%Y-%m-%d').date(),
-                doReg=datetime.strptime(fields[8], '%Y-%m-%d').date(),
-                party_affiliation=fields[9],
-                precinct_num=fields[10],
-                v20state=fields[11].upper() == 'TRUE',
-                v21town=fields[12].upper() == 'TRUE',
-                v21primary=fields[13].upper() == 'TRUE',
-                v22general=fields[14].upper() == 'TRUE',
-                v23town=fields[15].upper() == 'TRUE',
-                voter_score=int(fields[16]),
-
-            )
-
-            voter.save()
-            print(f'Created voter: {voter}')
-
-        except Exception as e:
-            print(f'Skipped: {fields}')
-            print(f'Error: {e}')
-    print(f'Done. Created {len(Voter.objects.all())} voters.')
\ No newline at end of file
+    def get_participation(self):
+        '''Return (election label, voted) for every election in ELECTIONS.'''
+        return [(label, bool(self.participation & ELECTION_BITS[name])) for name, label in ELECTIONS]
+
+class VoterRollup(models.Model):
+    '''Precomputed count of voters sharing the same party, birth year, voter
+       score, precinct and election participation pattern.
+       Rebuilt by the importer; the graphs are computed from these rows.'''
+
+    party_affiliation = models.CharField(max_length=2)
+    birth_year = models.IntegerField()
+    voter_score = models.IntegerField()
+    precinct_num = models.CharField(max_length=10)
+
+    # Election participation pattern
+    participation = ParticipationField(default=0)
+
+    # number of voters in this group
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        '''Return a string representation of this model instance.'''
+        return f'{self.count} voters ({self.party_affiliation}, {self.birth_year}, precinct {self.precinct_num})'
+
+class VoterImport(models.Model):
+    '''Record of one run of the voter importer.  The id of the latest import
+       is the data version used to invalidate cached analytics.'''
+
+    filename = models.TextField()
+    mode = models.CharField(max_length=10)
+    created = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    elapsed = models.FloatField(default=0)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        '''Return a string representation of this model instance.'''
+        return f'{self.mode} import of {self.filename} at {self.timestamp} ({self.total} voters)'
+
+def load_data(filename='data/newton_voters.csv'):
+    '''Function to load data records from CSV file into the Django database.
+       Kept for use from the shell; see the import_voters management command.'''
+    from .importer import import_voters
+
+    result = import_voters(filename)
+    print(f'Done. Created {result.created} voters, skipped {result.rejected} rows '
+          f'({result.rows_per_second:.0f} rows/s).')
+    return result
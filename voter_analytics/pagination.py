@@ -0,0 +1,153 @@
+# voter_analytics/pagination.py
+# seek-based (keyset) pagination for large ordered querysets
+
+import base64
+import json
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+def encode_cursor(direction, key):
+    '''Pack a direction ('next' or 'prev') and a sort key into an opaque string.'''
+    data = json.dumps([direction, *key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    '''Unpack a cursor made by encode_cursor(); raises ValueError if it is malformed.'''
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, *key = json.loads(data)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'invalid cursor: {e}')
+    if direction not in ('next', 'prev') or len(key) != length:
+        raise ValueError('invalid cursor')
+    return direction, key
+
+
+def seek_filter(fields, key, forward):
+    '''Return a Q selecting rows that sort after key (or before it when not
+       forward) on the given ascending fields.  The leading range on the first
+       field keeps the predicate usable by a composite index.'''
+    op = 'gt' if forward else 'lt'
+    bound = 'gte' if forward else 'lte'
+    q = Q()
+    for i in range(len(fields)):
+        equal = {fields[j]: key[j] for j in range(i)}
+        q |= Q(**equal, **{f'{fields[i]}__{op}': key[i]})
+    return Q(**{f'{fields[0]}__{bound}': key[0]}) & q
+
+
+class KeysetPage:
+    '''One page of results from a KeysetPaginator.'''
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    def next_cursor(self):
+        '''cursor for the page after this one, or None for an empty page.'''
+        if not self.object_list:
+            return None
+        return encode_cursor('next', self.paginator.key(self.object_list[-1]))
+
+    def previous_cursor(self):
+        '''cursor for the page before this one, or None for an empty page.'''
+        if not self.object_list:
+            return None
+        return encode_cursor('prev', self.paginator.key(self.object_list[0]))
+
+
+class KeysetPaginator:
+    '''Paginate a queryset by seeking past the sort key of the last row shown
+       instead of using OFFSET, so every page costs the same no matter how deep
+       it is.  ordering must be unique; end it with the primary key.
+
+       The total is only computed if asked for.  count_function, if given,
+       returns (count, exact) and can supply a cached or estimated total in
+       place of COUNT(*).'''
+
+    def __init__(self, queryset, per_page, ordering, count_function=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.count_function = count_function
+
+    @cached_property
+    def count_info(self):
+        '''(count, exact) for the whole result set.'''
+        if self.count_function:
+            return self.count_function()
+        return self.queryset.count(), True
+
+    @property
+    def count(self):
+        '''number of results, possibly estimated.'''
+        return self.count_info[0]
+
+    @property
+    def count_is_exact(self):
+        '''False when count is an estimate.'''
+        return self.count_info[1]
+
+    def key(self, obj):
+        '''Return the sort key of one object.'''
+        return [getattr(obj, field) for field in self.ordering]
+
+    def clean_key(self, key):
+        '''Convert the values of a decoded key to the types of the ordering
+           fields; raises ValidationError if one does not fit.'''
+        fields = [self.queryset.model._meta.get_field(name) for name in self.ordering]
+        values = [field.to_python(value) for field, value in zip(fields, key)]
+        if any(value is None for value in values):
+            raise ValidationError('null in cursor key')
+        return values
+
+    def page(self, cursor=None):
+        '''Return the page following (or preceding) cursor; the first page when cursor is empty.'''
+        direction, key = 'next', None
+        if cursor:
+            try:
+                direction, key = decode_cursor(cursor, len(self.ordering))
+                key = self.clean_key(key)
+            except (ValueError, ValidationError):
+                raise Http404('Invalid page cursor.')
+
+        forward = direction == 'next'
+        qs = self.queryset
+        if key is not None:
+            qs = qs.filter(seek_filter(self.ordering, key, forward))
+        if forward:
+            qs = qs.order_by(*self.ordering)
+        else:
+            qs = qs.order_by(*[f'-{field}' for field in self.ordering])
+
+        # fetch one extra row to learn whether there is more in this direction
+        rows = list(qs[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            # a stale cursor can point past the last row; there is nothing to go back from
+            return KeysetPage(rows, self, has_next=more, has_previous=key is not None and bool(rows))
+        rows.reverse()
+        return KeysetPage(rows, self, has_next=bool(rows), has_previous=more)
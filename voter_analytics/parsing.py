@@ -0,0 +1,115 @@
+# voter_analytics/parsing.py
+# parsing of voter CSV records, kept free of Django imports so that
+# worker processes can use it without setting up the project
+
+import csv
+import hashlib
+import os
+import time
+from datetime import datetime
+
+# order of the Voter fields produced by parse_row()
+VOTER_FIELDS = [
+    'last_name', 'first_name',
+    'st_number', 'st_name', 'apt_num', 'zip_code',
+    'doB', 'doReg',
+    'party_affiliation', 'precinct_num',
+    'v20state', 'v21town', 'v21primary', 'v22general', 'v23town',
+    'voter_score',
+    'participation',
+    'voter_id', 'row_hash',
+]
+
+# CSV columns holding the election participation flags, in bitmask order
+ELECTION_COLUMNS = range(11, 16)
+
+# size of the byte ranges handed to worker processes
+CHUNK_BYTES = 4 * 1024 * 1024
+
+# maximum number of rejected rows whose errors are kept for reporting
+MAX_ERRORS = 20
+
+
+def row_hash(fields):
+    '''Return a short digest of the content columns of a CSV record, used to
+       detect changed voters when re-importing a file.'''
+    content = '\x1f'.join(fields[1:17]).encode('utf-8')
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def parse_date(text):
+    '''Parse a YYYY-MM-DD date.  strptime is used rather than
+       date.fromisoformat(), which also accepts forms like 19900101.'''
+    return datetime.strptime(text, '%Y-%m-%d').date()
+
+
+def parse_row(fields):
+    '''Convert one CSV record into a tuple of Voter values in VOTER_FIELDS order.
+       Raises ValueError if the record is malformed.'''
+    if len(fields) < 17:
+        raise ValueError(f'expected 17 columns, found {len(fields)}')
+
+    voted = [fields[col].upper() == 'TRUE' for col in ELECTION_COLUMNS]
+    participation = 0
+    for bit, flag in enumerate(voted):
+        if flag:
+            participation |= 1 << bit
+
+    return (
+        fields[1],
+        fields[2],
+        fields[3],
+        fields[4],
+        fields[5] or None,
+        fields[6],
+        parse_date(fields[7]),
+        parse_date(fields[8]),
+        fields[9],
+        fields[10],
+        *voted,
+        int(fields[16]),
+        participation,
+        fields[0].strip() or None,
+        row_hash(fields),
+    )
+
+
+def chunk_ranges(filename, chunk_bytes=CHUNK_BYTES):
+    '''Split a voter file (after its header) into (start, end) byte ranges that
+       begin and end on line boundaries.  Assumes no quoted field contains a newline.'''
+    size = os.path.getsize(filename)
+    ranges = []
+    with open(filename, 'rb') as f:
+        f.readline()  # skip the header
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()  # move forward to the end of the current line
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_chunk(filename, start, end):
+    '''Parse every record in one byte range of a voter file.
+       Runs in a worker process and returns (rows, rejected, errors, pid, seconds).'''
+    started = time.perf_counter()
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+
+    rows = []
+    rejected = 0
+    errors = []
+    for n, fields in enumerate(csv.reader(data.splitlines()), start=1):
+        if not fields:
+            continue
+        try:
+            rows.append(parse_row(fields))
+        except (ValueError, IndexError) as e:
+            rejected += 1
+            if len(errors) < MAX_ERRORS:
+                errors.append(f'byte {start}, record {n}: {e}')
+
+    return rows, rejected, errors, os.getpid(), time.perf_counter() - started
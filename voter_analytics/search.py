@@ -0,0 +1,146 @@
+# voter_analytics/search.py
+# name and address lookup of voters, backed by an SQLite FTS5 index
+
+import difflib
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Voter
+
+# FTS5 table indexing the name and address columns of voter_analytics_voter
+FTS_TABLE = 'voter_analytics_voter_fts'
+
+# fts5vocab table listing the distinct terms of FTS_TABLE, used for typo correction
+VOCAB_TABLE = 'voter_analytics_voter_fts_vocab'
+
+# Voter columns held in the FTS index, in its column order
+FTS_COLUMNS = ['last_name', 'first_name', 'st_number', 'st_name', 'zip_code']
+
+# columns searched by each kind of lookup
+SEARCH_COLUMNS = {
+    'name': ['last_name', 'first_name'],
+    'address': ['st_number', 'st_name', 'zip_code'],
+}
+SEARCH_COLUMNS['all'] = SEARCH_COLUMNS['name'] + SEARCH_COLUMNS['address']
+
+# shortest word used in a lookup
+MIN_TOKEN_LENGTH = 2
+
+CREATE_SQL = [
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        last_name, first_name, st_number, st_name, zip_code,
+        content='voter_analytics_voter', content_rowid='id', prefix='2 3 4')''',
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, 'row')",
+]
+
+DROP_SQL = [
+    f'DROP TABLE IF EXISTS {VOCAB_TABLE}',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+_fts_found = False
+
+
+def fts_available():
+    '''True if the database is SQLite and the FTS index exists.'''
+    global _fts_found
+    if connection.vendor != 'sqlite':
+        return False
+    if not _fts_found:
+        _fts_found = FTS_TABLE in connection.introspection.table_names()
+    return _fts_found
+
+
+def rebuild_search_index():
+    '''Re-read every voter into the FTS index; called by the importer.'''
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+
+
+def update_search_index(voter_ids, remove=False, batch_size=1000):
+    '''Add the stored voters with the given voter IDs to the FTS index, or
+       with remove, take them out; removing must happen before the rows are
+       changed or deleted, since the index needs their old values.'''
+    if not fts_available():
+        return
+    columns = ', '.join(FTS_COLUMNS)
+    if remove:
+        sql = (f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+               f"SELECT 'delete', id, {columns} FROM voter_analytics_voter WHERE voter_id IN ")
+    else:
+        sql = (f"INSERT INTO {FTS_TABLE}(rowid, {columns}) "
+               f"SELECT id, {columns} FROM voter_analytics_voter WHERE voter_id IN ")
+    with connection.cursor() as cursor:
+        for i in range(0, len(voter_ids), batch_size):
+            batch = voter_ids[i:i + batch_size]
+            cursor.execute(sql + '(' + ', '.join(['%s'] * len(batch)) + ')', batch)
+
+
+def tokenize(query):
+    '''Split a search string into lower-case word tokens.'''
+    return re.findall(r'\w+', query.lower())
+
+
+def fts_query(alternatives, columns):
+    '''Build an FTS5 MATCH expression: every token must match one of its
+       alternatives as a prefix, within the given columns.'''
+    terms = []
+    for options in alternatives:
+        terms.append('(' + ' OR '.join(f'"{term}"*' for term in options) + ')')
+    return '{' + ' '.join(columns) + '} : (' + ' AND '.join(terms) + ')'
+
+
+def close_terms(token, limit=3):
+    '''Return indexed terms within a small edit distance of token, taken
+       from the terms sharing its first letter.'''
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT term FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s',
+                       [token[0], token[0] + '\uffff'])
+        terms = [row[0] for row in cursor.fetchall()]
+    return difflib.get_close_matches(token, terms, n=limit, cutoff=0.75)
+
+
+def match_ids(expression, limit):
+    '''Run an FTS5 MATCH and return the first limit voter ids.  Results are
+       not ranked: a short prefix can match most of the table, and sorting
+       all of it by rank would cost far more than the lookup itself.'''
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s',
+                       [expression, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_voters(query, field='all', limit=10):
+    '''Return up to limit Voters whose name (field='name'), address
+       (field='address') or either matches every word of query as a prefix.
+       When nothing matches, words are replaced by close spellings found in the
+       index, so small typos still find the voter.  Results are sorted by name.'''
+    # single letters match too much of the roll to be useful
+    tokens = [t for t in tokenize(query) if len(t) >= MIN_TOKEN_LENGTH]
+    columns = SEARCH_COLUMNS.get(field, SEARCH_COLUMNS['all'])
+    if not tokens:
+        return []
+
+    if not fts_available():
+        return list(fallback_search(tokens, columns)[:limit])
+
+    ids = match_ids(fts_query([[t] for t in tokens], columns), limit)
+    if not ids:
+        alternatives = [[t] + close_terms(t) for t in tokens]
+        ids = match_ids(fts_query(alternatives, columns), limit)
+
+    voters = Voter.objects.in_bulk(ids).values()
+    return sorted(voters, key=lambda v: (v.last_name, v.first_name, v.pk))
+
+
+def fallback_search(tokens, columns):
+    '''Prefix search without FTS, for databases other than SQLite.'''
+    qs = Voter.objects.all()
+    for token in tokens:
+        q = Q()
+        for column in columns:
+            q |= Q(**{f'{column}__istartswith': token})
+        qs = qs.filter(q)
+    return qs.order_by('last_name', 'first_name', 'id')
@@ -0,0 +1,150 @@
+# voter_analytics/synthetic.py
+# generation of synthetic voter files in the layout read by import_voters,
+# kept free of Django imports like parsing.py
+
+import csv
+import random
+from datetime import date, timedelta
+
+HEADER = [
+    'Voter ID Number', 'Last Name', 'First Name',
+    'Residential Address - Street Number', 'Residential Address - Street Name',
+    'Residential Address - Apartment Number', 'Residential Address - Zip Code',
+    'Date of Birth', 'Date of Registration', 'Party Affiliation', 'Precinct Number',
+    'v20state', 'v21town', 'v21primary', 'v22general', 'v23town', 'voter_score',
+]
+
+# party codes as they appear in the Newton file, with their approximate share
+PARTIES = [('U ', 0.58), ('D ', 0.30), ('R ', 0.08), ('L ', 0.01), ('J ', 0.01),
+           ('CC', 0.01), ('GR', 0.005), ('X ', 0.005)]
+
+# share of registered voters taking part in each election, in ELECTIONS order;
+# state and general elections draw far more voters than town elections and primaries
+TURNOUT = [0.78, 0.24, 0.18, 0.62, 0.22]
+
+LAST_NAMES = [
+    'SMITH', 'JOHNSON', 'WILLIAMS', 'BROWN', 'JONES', 'GARCIA', 'MILLER', 'DAVIS',
+    'RODRIGUEZ', 'MARTINEZ', 'HERNANDEZ', 'LOPEZ', 'GONZALEZ', 'WILSON', 'ANDERSON',
+    'THOMAS', 'TAYLOR', 'MOORE', 'JACKSON', 'MARTIN', 'LEE', 'PEREZ', 'THOMPSON',
+    'WHITE', 'HARRIS', 'SANCHEZ', 'CLARK', 'RAMIREZ', 'LEWIS', 'ROBINSON', 'WALKER',
+    'YOUNG', 'ALLEN', 'KING', 'WRIGHT', 'SCOTT', 'TORRES', 'NGUYEN', 'HILL', 'FLORES',
+    'GREEN', 'ADAMS', 'NELSON', 'BAKER', 'HALL', 'RIVERA', 'CAMPBELL', 'MITCHELL',
+    'CARTER', 'ROBERTS', 'COHEN', 'MURPHY', 'SULLIVAN', 'OBRIEN', 'KELLY', 'CHEN',
+    'WANG', 'KIM', 'PATEL', 'SHAH', 'GOLDBERG', 'KATZ', 'RYAN', 'WALSH', 'FITZGERALD',
+]
+
+FIRST_NAMES = [
+    'JAMES', 'MARY', 'ROBERT', 'PATRICIA', 'JOHN', 'JENNIFER', 'MICHAEL', 'LINDA',
+    'DAVID', 'ELIZABETH', 'WILLIAM', 'BARBARA', 'RICHARD', 'SUSAN', 'JOSEPH', 'JESSICA',
+    'THOMAS', 'SARAH', 'CHRISTOPHER', 'KAREN', 'CHARLES', 'LISA', 'DANIEL', 'NANCY',
+    'MATTHEW', 'BETTY', 'ANTHONY', 'MARGARET', 'MARK', 'SANDRA', 'DONALD', 'ASHLEY',
+    'STEVEN', 'KIMBERLY', 'PAUL', 'EMILY', 'ANDREW', 'DONNA', 'JOSHUA', 'MICHELLE',
+    'WEI', 'MEI', 'RAJ', 'PRIYA', 'SEAN', 'MAEVE', 'NOAH', 'OLIVIA', 'ETHAN', 'EMMA',
+]
+
+STREETS = [
+    'Washington St', 'Commonwealth Ave', 'Beacon St', 'Centre St', 'Walnut St',
+    'Chestnut St', 'Boylston St', 'Watertown St', 'Lowell Ave', 'Highland St',
+    'Parker St', 'Dedham St', 'Auburn St', 'Lexington St', 'California St',
+    'Crafts St', 'Homer St', 'Ward St', 'Waltham St', 'Elliot St', 'Jackson Rd',
+    'Cabot St', 'Langley Rd', 'Adams St', 'Park St', 'Church St', 'Pearl St',
+    'Linwood Ave', 'Otis St', 'Hammond St',
+]
+
+ZIP_CODES = ['02458', '02459', '02460', '02461', '02462', '02464', '02465', '02466', '02467', '02468']
+
+PRECINCTS = [f'{ward}{letter}' for ward in range(1, 9) for letter in 'ABCD']
+
+
+def zipf_weights(n, exponent=1.1):
+    '''Weights giving the first items of a list of n most of the picks, the way
+       a few names dominate any real roll.'''
+    return [1 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+class VoterGenerator:
+    '''Produce synthetic voter records with realistic distributions: skewed
+       name frequencies, a party mix close to the Newton file, birth years
+       centred on the 1960s to 1980s, and participation driven by a per-voter
+       propensity so that regular voters vote in most elections and the voter
+       score follows from the flags.'''
+
+    def __init__(self, seed=None, today=date(2024, 1, 1)):
+        self.random = random.Random(seed)
+        self.today = today
+        self.parties = [party for party, share in PARTIES]
+        self.party_weights = [share for party, share in PARTIES]
+        self.last_weights = zipf_weights(len(LAST_NAMES))
+        self.first_weights = zipf_weights(len(FIRST_NAMES), 0.8)
+        # each street has a home precinct and zip code, so addresses cluster
+        self.streets = [(street, self.random.choice(PRECINCTS), self.random.choice(ZIP_CODES))
+                        for street in STREETS]
+
+    def birth_date(self):
+        '''A birth date for a voter aged between 18 and 104.'''
+        rnd = self.random
+        age = min(max(rnd.gauss(50, 18), 18), 104)
+        return self.today - timedelta(days=int(age * 365.25) + rnd.randrange(365))
+
+    def registration_date(self, born):
+        '''A registration date between the 18th birthday and today.'''
+        eligible = date(born.year + 18, born.month, min(born.day, 28))
+        days = (self.today - eligible).days
+        # most voters register within a few years of becoming eligible
+        return eligible + timedelta(days=int(min(self.random.expovariate(1 / 1500), days)))
+
+    def participation(self, registered):
+        '''Election flags for one voter, from a propensity shared by all their
+           elections; elections held before registration are never voted in.'''
+        rnd = self.random
+        propensity = rnd.betavariate(0.9, 0.9)
+        flags = []
+        for turnout, held in zip(TURNOUT, (2020, 2021, 2021, 2022, 2023)):
+            if registered.year > held:
+                flags.append(False)
+            else:
+                # scale so that the average voter turns out at the base rate
+                flags.append(rnd.random() < min(1.0, 2 * turnout * propensity))
+        return flags
+
+    def record(self, number):
+        '''Return one CSV record as a list of strings.'''
+        rnd = self.random
+        street, precinct, zip_code = rnd.choice(self.streets)
+        born = self.birth_date()
+        registered = self.registration_date(born)
+        voted = self.participation(registered)
+        return [
+            f'{number:08d}',
+            rnd.choices(LAST_NAMES, self.last_weights)[0],
+            rnd.choices(FIRST_NAMES, self.first_weights)[0],
+            str(rnd.randint(1, 400)),
+            street,
+            rnd.choice(['1', '2', '3', 'A', 'B']) if rnd.random() < 0.2 else '',
+            zip_code,
+            born.isoformat(),
+            registered.isoformat(),
+            rnd.choices(self.parties, self.party_weights)[0],
+            precinct,
+            *['TRUE' if flag else 'FALSE' for flag in voted],
+            str(sum(voted)),
+        ]
+
+    def records(self, count):
+        '''Yield count records with consecutive voter IDs.'''
+        for number in range(count):
+            yield self.record(number)
+
+
+def write_voter_file(filename, count, seed=None, progress=None, progress_every=100000):
+    '''Write a synthetic voter CSV file of count records.  progress, if given,
+       is called with the number of records written so far.'''
+    generator = VoterGenerator(seed)
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for n, record in enumerate(generator.records(count), start=1):
+            writer.writerow(record)
+            if progress and n % progress_every == 0:
+                progress(n)
+    return count
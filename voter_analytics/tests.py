@@ -1,3 +1,264 @@
-from django.test import TestCase
+# voter_analytics/tests.py
+# tests of voter file parsing and importing
 
-# Create your tests here.
+import csv
+import os
+import tempfile
+from unittest import mock, skipUnless
+from django.http import Http404
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from . import columnar, importer
+from .aggregates import rollup_chart_data, rebuild_rollups, voter_chart_data
+from .filters import VoterFilter
+from .models import Voter, VoterImport, VoterRollup
+from .pagination import KeysetPaginator, encode_cursor
+from .parsing import parse_row
+from .synthetic import HEADER, VoterGenerator
+from .views import VoterExportView
+
+
+def write_records(records):
+    '''Write records to a temporary voter CSV file and return its name.'''
+    f = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+    with f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(records)
+    return f.name
+
+
+class VoterFileTestCase(TestCase):
+    '''Base class making synthetic voter files that are removed after each test.'''
+
+    def setUp(self):
+        self.generator = VoterGenerator(seed=1)
+        self.files = []
+
+    def tearDown(self):
+        for filename in self.files:
+            os.remove(filename)
+
+    def voter_file(self, records):
+        filename = write_records(records)
+        self.files.append(filename)
+        return filename
+
+
+class ParseRowTests(VoterFileTestCase):
+
+    def test_dates_must_be_year_month_day(self):
+        record = self.generator.record(1)
+        for bad in ['19900101', '2020-W01-1', '1990-13-01']:
+            record[7] = bad
+            with self.assertRaises(ValueError):
+                parse_row(record)
+
+    def test_valid_record(self):
+        row = parse_row(self.generator.record(7))
+        self.assertEqual(row[-2], '00000007')
+
+
+class ImportTests(VoterFileTestCase):
+
+    def test_replace_is_all_or_nothing(self):
+        importer.import_voters(self.voter_file(self.generator.records(30)))
+        replacement = self.voter_file(VoterGenerator(seed=2).record(n) for n in range(100, 150))
+
+        calls = []
+
+        def failing_write(voters, *args, **kwargs):
+            calls.append(len(voters))
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            Voter.objects.bulk_create(voters)
+            return len(voters)
+
+        with mock.patch.object(importer, 'write_voters', failing_write):
+            with self.assertRaises(RuntimeError):
+                importer.import_voters(replacement, transaction_size=20, replace=True)
+
+        self.assertEqual(Voter.objects.count(), 30)
+        self.assertFalse(Voter.objects.filter(voter_id='00000100').exists())
+
+    def test_duplicate_voter_ids_are_rejected(self):
+        records = list(self.generator.records(10))
+        records.append(list(records[3]))
+        result = importer.import_voters(self.voter_file(records), replace=True)
+        self.assertEqual((result.created, result.rejected), (10, 1))
+
+        # appending the same file again rejects every stored voter ID
+        result = importer.import_voters(self.voter_file(records))
+        self.assertEqual((result.created, result.rejected), (0, 11))
+        self.assertEqual(Voter.objects.count(), 10)
+
+
+    def test_replace_with_no_valid_rows_empties_the_rollups(self):
+        importer.import_voters(self.voter_file(self.generator.records(30)))
+        records = list(self.generator.records(5))
+        for record in records:
+            record[7] = 'not a date'
+        imports = VoterImport.objects.count()
+
+        result = importer.import_voters(self.voter_file(records), replace=True)
+        self.assertEqual((result.created, result.deleted, result.rejected), (0, 30, 5))
+        self.assertEqual(Voter.objects.count(), 0)
+        self.assertFalse(VoterRollup.objects.exists())
+        self.assertEqual(VoterImport.objects.count(), imports + 1)
+
+class SyncTests(VoterFileTestCase):
+
+    def rollups(self):
+        return sorted(VoterRollup.objects.values_list('party_affiliation', 'voter_score', 'precinct_num',
+                                                      'participation', 'birth_year', 'count'))
+
+    def test_unchanged_file_records_nothing(self):
+        filename = self.voter_file(self.generator.records(20))
+        importer.sync_voters(filename)
+        imports = VoterImport.objects.count()
+        result = importer.sync_voters(filename)
+        self.assertEqual((result.created, result.updated, result.deleted), (0, 0, 0))
+        self.assertEqual(VoterImport.objects.count(), imports)
+
+    def test_rollups_follow_changes(self):
+        records = list(self.generator.records(40))
+        importer.sync_voters(self.voter_file(records))
+
+        for record in records[:10]:
+            record[9] = 'R '
+        records = records[5:] + [VoterGenerator(seed=3).record(n) for n in range(100, 105)]
+        result = importer.sync_voters(self.voter_file(records))
+        self.assertEqual((result.created, result.updated, result.deleted), (5, 5, 5))
+
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_voters_without_id_are_removed_only_by_a_finished_sync(self):
+        records = list(self.generator.records(10))
+        for record in records[:3]:
+            record[0] = ''
+        importer.import_voters(self.voter_file(records))
+        filename = self.voter_file(records[3:] + [VoterGenerator(seed=3).record(100)])
+
+        with mock.patch.object(importer, 'upsert_voters', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                importer.sync_voters(filename)
+        self.assertEqual(Voter.objects.filter(voter_id=None).count(), 3)
+
+        result = importer.sync_voters(filename)
+        self.assertEqual((result.created, result.deleted), (1, 3))
+        self.assertEqual(Voter.objects.count(), 8)
+
+
+class KeysetPaginatorTests(VoterFileTestCase):
+
+    ordering = ['last_name', 'first_name', 'id']
+
+    def setUp(self):
+        super().setUp()
+        importer.import_voters(self.voter_file(self.generator.records(25)))
+        self.voters = list(Voter.objects.order_by(*self.ordering))
+        self.paginator = KeysetPaginator(Voter.objects.all(), 10, self.ordering)
+
+    def test_first_page(self):
+        page = self.paginator.page()
+        self.assertEqual(page.object_list, self.voters[:10])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_next_and_previous(self):
+        second = self.paginator.page(self.paginator.page().next_cursor())
+        self.assertEqual(second.object_list, self.voters[10:20])
+        last = self.paginator.page(second.next_cursor())
+        self.assertEqual(last.object_list, self.voters[20:])
+        self.assertFalse(last.has_next())
+
+        back = self.paginator.page(last.previous_cursor())
+        self.assertEqual(back.object_list, self.voters[10:20])
+        self.assertTrue(back.has_previous())
+
+    def test_cursor_past_the_end(self):
+        key = self.paginator.key(self.voters[-1])
+        page = self.paginator.page(encode_cursor('next', key))
+        self.assertEqual(page.object_list, [])
+        self.assertFalse(page.has_previous())
+        self.assertIsNone(page.previous_cursor())
+        self.assertIsNone(page.next_cursor())
+
+    def test_bad_cursors(self):
+        for cursor in ['not a cursor', encode_cursor('sideways', ['A', 'A', 1]),
+                       encode_cursor('next', ['A', 'A']), encode_cursor('next', ['A', 'A', 'abc']),
+                       encode_cursor('next', ['A', None, 1])]:
+            with self.assertRaises(Http404):
+                self.paginator.page(cursor)
+
+
+@mock.patch.object(VoterExportView, 'chunk_size', 10)
+class ExportTests(VoterFileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        importer.import_voters(self.voter_file(self.generator.records(25)))
+        ids = Voter.objects.order_by(*VoterExportView.ordering).values_list('voter_id', flat=True)
+        self.expected = ['voter_id'] + list(ids)
+
+    def voter_ids(self, content):
+        return [line.split(',')[0] for line in content.decode().splitlines()]
+
+    def test_csv_export(self):
+        response = self.client.get(reverse('voter_export'))
+        self.assertFalse(response.is_async)
+        self.assertEqual(self.voter_ids(b''.join(response.streaming_content)), self.expected)
+
+    async def test_asgi_export_streams_asynchronously(self):
+        response = await self.async_client.get(reverse('voter_export'))
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(self.voter_ids(content), self.expected)
+
+
+@skipUnless(columnar.available(), 'NumPy is not installed')
+class SnapshotTests(VoterFileTestCase):
+
+    def test_new_snapshot_survives_higher_old_versions(self):
+        importer.import_voters(self.voter_file(self.generator.records(5)))
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(VOTER_ANALYTICS_SNAPSHOT_DIR=directory):
+            # left over from before a database reset
+            columnar.write_snapshot(98)
+            columnar.write_snapshot(99)
+            columnar.write_snapshot(3)
+            self.assertTrue(os.path.exists(columnar.snapshot_paths(3)[0]))
+            self.assertEqual(len(columnar.open_columns(3)), 5)
+
+
+class ChartDataParityTests(VoterFileTestCase):
+    '''Each graph backend must agree with counting the Voter rows directly.'''
+
+    def setUp(self):
+        super().setUp()
+        importer.import_voters(self.voter_file(self.generator.records(200)))
+        party = Voter.objects.values_list('party_affiliation', flat=True).first()
+        self.filters = [
+            VoterFilter(),
+            VoterFilter(party=party),
+            VoterFilter(min_year=1960, max_year=1990),
+            VoterFilter(min_score=3),
+            VoterFilter(elections=['v20state', 'v22general'], match='all'),
+            VoterFilter(party=party, min_score=1, elections=['v21town', 'v23town']),
+        ]
+
+    def assertSameCharts(self, chart_data):
+        for voter_filter in self.filters:
+            with self.subTest(filter=voter_filter.signature()):
+                expected = voter_chart_data(Voter.objects.filter(voter_filter.voter_q()))
+                self.assertEqual(vars(chart_data(voter_filter)), vars(expected))
+
+    def test_rollup_backend(self):
+        self.assertSameCharts(lambda f: rollup_chart_data(VoterRollup.objects.filter(f.rollup_q())))
+
+    @skipUnless(columnar.available(), 'NumPy is not installed')
+    def test_columnar_backend(self):
+        columns = columnar.VoterColumns.load()
+        self.assertSameCharts(columns.chart_data)
@@ -1,15 +1,23 @@
 # voter_analytics/urls.py
 # Amy Ho, aho@bu.edu
 
+from django.conf import settings
 from django.urls import path
 from . import views 
  
+# the async graphs view is used when serving through ASGI
+GraphsView = views.AsyncGraphsView if settings.VOTER_ANALYTICS_ASYNC_GRAPHS else views.GraphsView
+
 urlpatterns = [
     # map the URL (empty string) to the view
 	path(r'', views.VotersListView.as_view(), name='home'),
     path(r'search/', views.Search_View, name='search'),
-    path(r'graphs/', views.GraphsView.as_view(), name='graphs'),
+    path(r'graphs/', GraphsView.as_view(), name='graphs'),
+    path(r'precincts/', views.PrecinctView.as_view(), name='precincts'),
+    path(r'precincts.json', views.precincts_json, name='precincts_json'),
     path(r'voter', views.VotersListView.as_view(), name='voters_list'),
+    path(r'voter/lookup', views.voter_lookup, name='voter_lookup'),
+    path(r'voter/export', views.VoterExportView.as_view(), name='voter_export'),
     path(r'voter/<int:pk>', views.VoterDetailView.as_view(), name='voter_detail'),
 ]
  
\ No newline at end of file
@@ -1,69 +1,167 @@
 # voter_analytics/views.py
 # Amy Ho, aho@bu.edu
 
+import asyncio
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render
-from django.views.generic import ListView, DetailView
-from .models import Voter
-from django.db.models import Q, Count
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.generic import ListView, DetailView, TemplateView, View
+from .models import Voter, VoterRollup, ELECTIONS, ELECTION_BITS
+from .aggregates import achart_data, chart_data, voter_count, precinct_turnout
+from .pagination import KeysetPaginator, seek_filter
+from .filters import VoterFilter, VoterFilterMixin
+from .cache import cached, acached, cache_stats
+from .search import search_voters
 import plotly.graph_objs as go
-from plotly.offline import plot
+from cs412.charts import render_chart
 
-class VotersListView(ListView):
+class VotersListView(VoterFilterMixin, ListView):
     '''View to display voter information.'''
 
     template_name = 'voter_analytics/voters.html'
     model = Voter
     context_object_name = 'voters'
     paginate_by = 100 # list 100 per page
+    ordering = ['last_name', 'first_name', 'id'] # unique, matches voter_name_order_idx
 
     def get_queryset(self):
         qs = super().get_queryset()
-        qs = self.apply_filters(qs)
-        return qs.order_by('last_name', 'first_name')
-
-    def apply_filters(self, qs):
-        '''Apply filters to queryset - reusable for both list and graph views'''
-        party = self.request.GET.get('party')
-        min_year = self.request.GET.get('min_year')
-        max_year = self.request.GET.get('max_year')
-        min_score = self.request.GET.get('min_score')
-        elections = self.request.GET.getlist('elections')
-        
-        if party:
-            qs = qs.filter(party_affiliation=party)
-        
-        if min_year:
-            qs = qs.filter(doB__year__gte=min_year)
-        
-        if max_year:
-            qs = qs.filter(doB__year__lte=max_year)
-        
-        if min_score:
-            qs = qs.filter(voter_score__gte=min_score)
-        
-        election_filters = Q()
-        if 'v20state' in elections:
-            election_filters |= Q(v20state=True)
-        if 'v21town' in elections:
-            election_filters |= Q(v21town=True)
-        if 'v21primary' in elections:
-            election_filters |= Q(v21primary=True)
-        if 'v22general' in elections:
-            election_filters |= Q(v22general=True)
-        if 'v23town' in elections:
-            election_filters |= Q(v23town=True)
-        
-        if elections:
-            qs = qs.filter(election_filters)
-        
-        return qs
+        return qs.filter(self.get_voter_filter().voter_q())
+
+    def paginate_queryset(self, queryset, page_size):
+        '''Page through voters with a keyset cursor instead of OFFSET, so deep
+           pages cost the same as the first and no COUNT(*) is needed.'''
+        paginator = KeysetPaginator(queryset, page_size, self.get_ordering(), self.count_voters)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return (paginator, page, page.object_list, page.has_other_pages())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['years'] = range(1920, 2021)
         context['scores'] = range(0, 6)
+        context['elections'] = ELECTIONS
         return context
 
+    def count_voters(self):
+        '''Return (count, exact) for the filtered voters, cached per filter
+           signature and data version.  Large counts are estimated unless the
+           exact total is requested with ?total=1.'''
+        voter_filter = self.get_voter_filter()
+        exact = bool(self.request.GET.get('total'))
+        return cached('count', (voter_filter.signature(), exact),
+                      lambda: voter_count(voter_filter, exact))
+
+class Echo:
+    '''File-like object whose write() returns the value instead of storing it,
+       so csv.writer can format rows for a streaming response.'''
+
+    def write(self, value):
+        return value
+
+class VoterExportView(VoterFilterMixin, View):
+    '''Stream the voters matching the list filters as CSV or newline-delimited JSON.'''
+
+    # columns of Voter in the export, followed by one column per election and
+    # the voter score, the same layout as the files read by import_voters
+    fields = ['voter_id', 'last_name', 'first_name', 'st_number', 'st_name', 'apt_num',
+              'zip_code', 'doB', 'doReg', 'party_affiliation', 'precinct_num']
+    ordering = ['last_name', 'first_name', 'id'] # unique, matches voter_name_order_idx
+    chunk_size = 2000 # rows fetched from the database at a time
+
+    def get(self, request, *args, **kwargs):
+        '''Return a streaming response in the requested format (csv by default).'''
+        if request.GET.get('format') == 'ndjson':
+            header, encode, content_type, extension = '', self.ndjson_text, 'application/x-ndjson', 'ndjson'
+        else:
+            header, encode, content_type, extension = self.csv_text([self.header()]), self.csv_text, 'text/csv', 'csv'
+
+        # under ASGI a sync iterator would be read whole before the first byte
+        # is sent, so the chunks are fetched through sync_to_async instead
+        if isinstance(request, ASGIRequest):
+            content = self.acontent(header, encode)
+        else:
+            content = self.content(header, encode)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="voters.{extension}"'
+        return response
+
+    def fetch_chunk(self, key=None):
+        '''Return the next chunk_size matching voters after the sort key key,
+           as tuples of the export fields, participation, voter score and
+           sort key.'''
+        voters = Voter.objects.filter(self.get_voter_filter().voter_q())
+        if key is not None:
+            voters = voters.filter(seek_filter(self.ordering, key, forward=True))
+        voters = (voters.order_by(*self.ordering)
+                  .values_list(*self.fields, 'participation', 'voter_score', *self.ordering))
+        return list(voters[:self.chunk_size])
+
+    def export_rows(self, chunk):
+        '''Return the rows of a chunk as exported: the export fields, a flag
+           per election and the voter score.'''
+        bits = [1 << i for i in range(len(ELECTIONS))]
+        rows = []
+        for row in chunk:
+            *values, participation, voter_score = row[:-len(self.ordering)]
+            rows.append((*values, *[bool(participation & bit) for bit in bits], voter_score))
+        return rows
+
+    def chunks(self):
+        '''Yield the export rows a chunk at a time, seeking past the last row
+           of each chunk.'''
+        key = None
+        while True:
+            chunk = self.fetch_chunk(key)
+            if chunk:
+                yield self.export_rows(chunk)
+            if len(chunk) < self.chunk_size:
+                return
+            key = chunk[-1][-len(self.ordering):]
+
+    async def achunks(self):
+        '''Async version of chunks(), running each query in a worker thread.'''
+        key = None
+        while True:
+            chunk = await sync_to_async(self.fetch_chunk)(key)
+            if chunk:
+                yield self.export_rows(chunk)
+            if len(chunk) < self.chunk_size:
+                return
+            key = chunk[-1][-len(self.ordering):]
+
+    def content(self, header, encode):
+        '''Yield header, then the export encoded a chunk at a time.'''
+        if header:
+            yield header
+        for rows in self.chunks():
+            yield encode(rows)
+
+    async def acontent(self, header, encode):
+        '''Async version of content().'''
+        if header:
+            yield header
+        async for rows in self.achunks():
+            yield encode(rows)
+
+    def header(self):
+        '''Return the column names of the export.'''
+        return self.fields + [name for name, label in ELECTIONS] + ['voter_score']
+
+    def csv_text(self, rows):
+        '''Return rows as CSV text.'''
+        writer = csv.writer(Echo())
+        return ''.join(writer.writerow(row) for row in rows)
+
+    def ndjson_text(self, rows):
+        '''Return rows as one JSON object per line.'''
+        header = self.header()
+        return ''.join(json.dumps(dict(zip(header, row)), default=str) + '\n' for row in rows)
+
 class VoterDetailView(DetailView):
     '''View to display detailed information for a single voter.'''
     
@@ -75,58 +173,37 @@ def Search_View(request):
     '''View to display the search form.'''
     context = {
         'years': range(1920, 2021),
-        'scores': range(0, 6)
+        'scores': range(0, 6),
+        'elections': ELECTIONS,
     }
     return render(request, 'voter_analytics/search.html', context)
 
-class GraphsView(ListView):
-    '''View to display graphs of voter data.'''
+def voter_lookup(request):
+    '''JSON typeahead: voters whose name or address starts with the words in ?q=.
+       ?field=name or ?field=address limits the columns searched.'''
+    query = request.GET.get('q', '')
+    field = request.GET.get('field', 'all')
+    voters = search_voters(query, field=field, limit=10)
+
+    results = [{
+        'id': voter.pk,
+        'name': f'{voter.first_name} {voter.last_name}',
+        'address': f'{voter.st_number} {voter.st_name}, {voter.zip_code}',
+        'url': reverse('voter_detail', kwargs={'pk': voter.pk}),
+    } for voter in voters]
+    return JsonResponse({'query': query, 'results': results})
+
+class GraphsView(VoterFilterMixin, ListView):
+    '''View to display graphs of voter data, computed from the precomputed
+       VoterRollup groups rather than from individual voters.'''
     
     template_name = 'voter_analytics/graphs.html'
-    model = Voter
-    context_object_name = 'voters'
+    model = VoterRollup
+    context_object_name = 'rollups'
 
     def get_queryset(self):
         qs = super().get_queryset()
-        qs = self.apply_filters(qs)
-        return qs
-
-    def apply_filters(self, qs):
-        '''Apply filters to queryset - reusable for both list and graph views'''
-        party = self.request.GET.get('party')
-        min_year = self.request.GET.get('min_year')
-        max_year = self.request.GET.get('max_year')
-        min_score = self.request.GET.get('min_score')
-        elections = self.request.GET.getlist('elections')
-        
-        if party:
-            qs = qs.filter(party_affiliation=party)
-        
-        if min_year:
-            qs = qs.filter(doB__year__gte=min_year)
-        
-        if max_year:
-            qs = qs.filter(doB__year__lte=max_year)
-        
-        if min_score:
-            qs = qs.filter(voter_score__gte=min_score)
-        
-        election_filters = Q()
-        if 'v20state' in elections:
-            election_filters |= Q(v20state=True)
-        if 'v21town' in elections:
-            election_filters |= Q(v21town=True)
-        if 'v21primary' in elections:
-            election_filters |= Q(v21primary=True)
-        if 'v22general' in elections:
-            election_filters |= Q(v22general=True)
-        if 'v23town' in elections:
-            election_filters |= Q(v23town=True)
-        
-        if elections:
-            qs = qs.filter(election_filters)
-        
-        return qs
+        return qs.filter(self.get_voter_filter().rollup_q())
 
     def get_context_data(self, **kwargs):
         '''
@@ -135,94 +212,71 @@ class GraphsView(ListView):
         # start with superclass context
         context = super().get_context_data(**kwargs)
         
-        # Get filtered queryset
-        filtered_voters = self.get_queryset()
-        
-        # Generate graphs
-        context['birth_year_histogram'] = self.create_birth_year_histogram(filtered_voters)
-        context['party_pie_chart'] = self.create_party_pie_chart(filtered_voters)
-        context['election_participation_histogram'] = self.create_election_participation_histogram(filtered_voters)
+        # Reuse the graphs built for the same filters on the same data
+        signature = self.get_voter_filter().signature()
+        context.update(cached('graphs', signature, self.create_graphs))
+        context['cache_stats'] = cache_stats()
         
         # Add filter options to context
-        context['years'] = range(1920, 2021)
-        context['scores'] = range(0, 6)
-
-        context['selected_elections'] = self.request.GET.getlist('elections')
+        context.update(self.get_filter_options())
         
         return context
 
-    def create_birth_year_histogram(self, voters):
+    def get_filter_options(self):
+        '''Return the choices shown in the filter form.'''
+        return {
+            'years': range(1920, 2021),
+            'scores': range(0, 6),
+            'elections': ELECTIONS,
+            'selected_elections': self.request.GET.getlist('elections'),
+        }
+
+    def get_chart_builders(self):
+        '''Return the context name and builder method of each graph.'''
+        return {
+            'birth_year_histogram': self.create_birth_year_histogram,
+            'party_pie_chart': self.create_party_pie_chart,
+            'election_participation_histogram': self.create_election_participation_histogram,
+        }
+
+    def create_graphs(self):
+        '''Compute the chart data and render all graphs.'''
+        # Aggregate once for all graphs with the configured backend
+        data = chart_data(self.get_voter_filter())
+        
+        graphs = {'chart_data': data}
+        for name, build in self.get_chart_builders().items():
+            graphs[name] = build(data)
+        return graphs
+
+    def create_birth_year_histogram(self, data):
         '''Create histogram of voters by birth year'''
-        # Extract birth years from the filtered voters
-        birth_years = list(voters.values_list('doB__year', flat=True))
-        
-        # Create histogram
-        fig = go.Histogram(x=birth_years, nbinsx=50)
+        # Bin the per-year counts, weighting each year by its number of voters
+        fig = go.Histogram(x=data.years, y=data.year_counts, histfunc='sum', nbinsx=50)
         title_text = "Distribution of Voters by Birth Year"
         
         # Obtain the graph as an HTML div
-        graph_div = plot(
-            {"data": [fig], "layout_title_text": title_text},
-            auto_open=False,
-            output_type="div"
-        )
+        graph_div = render_chart({"data": [fig], "layout_title_text": title_text})
         
         return graph_div
 
-    def create_party_pie_chart(self, voters):
+    def create_party_pie_chart(self, data):
         '''Create pie chart of voters by party affiliation'''
-        # Count voters by party affiliation
-        party_counts = voters.values('party_affiliation').annotate(count=Count('id'))
-        
-        # Prepare data for pie chart
-        parties = []
-        counts = []
-        for item in party_counts:
-            parties.append(item['party_affiliation'])
-            counts.append(item['count'])
-        
         # Create pie chart
-        fig = go.Pie(labels=parties, values=counts)
+        fig = go.Pie(labels=data.parties, values=data.party_counts)
         title_text = "Distribution of Voters by Party Affiliation"
         
         # Obtain the graph as an HTML div
-        graph_div = plot(
-            {"data": [fig], "layout_title_text": title_text},
-            auto_open=False,
-            output_type="div"
-        )
+        graph_div = render_chart({"data": [fig], "layout_title_text": title_text})
         
         return graph_div
 
-    def create_election_participation_histogram(self, voters):
+    def create_election_participation_histogram(self, data):
         '''Create histogram of election participation'''
-        print(f"Total voters in query: {voters.count()}")
-        
-        # Debug: Check individual election counts
-        v20state_count = voters.filter(v20state=True).count()
-        v21town_count = voters.filter(v21town=True).count()
-        v21primary_count = voters.filter(v21primary=True).count()
-        v22general_count = voters.filter(v22general=True).count()
-        v23town_count = voters.filter(v23town=True).count()
-        
-        print(f"Election counts - v20state: {v20state_count}, v21town: {v21town_count}, v21primary: {v21primary_count}, v22general: {v22general_count}, v23town: {v23town_count}")
-        
-        # Prepare data for bar chart
-        election_names = ['2020 State', '2021 Town', '2021 Primary', '2022 General', '2023 Town']
-        participation_counts = [
-            v20state_count,
-            v21town_count,
-            v21primary_count,
-            v22general_count,
-            v23town_count
-        ]
-        
-        print(f"Participation counts: {participation_counts}")
-        
         # Create bar chart
         fig = go.Bar(
-            x=election_names, 
-            y=participation_counts,
+            x=data.elections, 
+            y=data.participation,
             marker_color='lightblue'
         )
         
@@ -234,10 +288,115 @@ class GraphsView(ListView):
         )
         
         # Obtain the graph as an HTML div
-        graph_div = plot(
-            {"data": [fig], "layout": layout},
-            auto_open=False,
-            output_type="div"
-        )
+        graph_div = render_chart({"data": [fig], "layout": layout})
         
-        return graph_div
\ No newline at end of file
+        return graph_div
+
+# threads rendering plotly figures for AsyncGraphsView; bounded so that a
+# burst of requests cannot start an unbounded number of threads, and only
+# started once the async view is first used
+_render_pool = None
+
+def render_pool():
+    '''Return the thread pool rendering graphs for AsyncGraphsView.'''
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='voter-graphs')
+    return _render_pool
+
+class AsyncGraphsView(GraphsView):
+    '''Async version of GraphsView for the ASGI server.
+
+       The rollup aggregate is read with the async ORM and the cache through
+       its async API, and the graphs are rendered in a thread pool, so the
+       event loop can serve other requests while this one waits.  Django
+       still runs these database and cache calls one at a time on its sync
+       thread, so a single page is no faster than with GraphsView.'''
+
+    async def get(self, request, *args, **kwargs):
+        voter_filter = self.get_voter_filter()
+        graphs = await acached('graphs', voter_filter.signature(), self.acreate_graphs)
+        stats = await sync_to_async(cache_stats)()
+
+        context = {**graphs, **self.get_filter_options(), 'cache_stats': stats, 'view': self}
+        # template rendering may touch the session, so it stays on the ORM thread
+        return await sync_to_async(render)(request, self.template_name, context)
+
+    async def acreate_graphs(self):
+        '''Compute the chart data, then render the graphs in the thread pool.'''
+        data = await achart_data(self.get_voter_filter())
+
+        loop = asyncio.get_running_loop()
+        builders = self.get_chart_builders()
+        divs = await asyncio.gather(*[loop.run_in_executor(render_pool(), build, data)
+                                      for build in builders.values()])
+        return {'chart_data': data, **dict(zip(builders, divs))}
+
+def precinct_data(voter_filter):
+    '''Return the precinct turnout for a VoterFilter, cached per data version.'''
+    return cached('precincts', voter_filter.signature(), lambda: precinct_turnout(voter_filter))
+
+def precincts_json(request):
+    '''JSON turnout of every precinct in each election, by party.  Accepts the
+       same filters as the voter list.'''
+    precincts = precinct_data(VoterFilter.from_querydict(request.GET))
+    elections = [{'name': name, 'label': label} for name, label in ELECTIONS]
+    return JsonResponse({'elections': elections, 'precincts': precincts})
+
+class PrecinctView(VoterFilterMixin, TemplateView):
+    '''View to display turnout by precinct for one election, by party.'''
+
+    template_name = 'voter_analytics/precincts.html'
+
+    def get_election(self):
+        '''the election chosen with ?election=, the first one by default.'''
+        election = self.request.GET.get('election')
+        return election if election in ELECTION_BITS else ELECTIONS[0][0]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        voter_filter = self.get_voter_filter()
+        election = self.get_election()
+
+        precincts = precinct_data(voter_filter)
+        context['precinct_chart'] = cached('precinct_chart', (voter_filter.signature(), election),
+                                           lambda: self.create_precinct_chart(precincts, election))
+        context['precincts'] = [
+            (p['precinct'], p['voters'],
+             [round(100 * p['voted'][name] / p['voters']) if p['voters'] else 0 for name, label in ELECTIONS])
+            for p in precincts
+        ]
+
+        context['years'] = range(1920, 2021)
+        context['scores'] = range(0, 6)
+        context['elections'] = ELECTIONS
+        context['election'] = election
+        return context
+
+    def create_precinct_chart(self, precincts, election):
+        '''Create a stacked bar chart of the voters in each precinct who voted
+           in election, one bar segment per party.'''
+        names = [p['precinct'] for p in precincts]
+        parties = sorted({party for p in precincts for party in p['parties']})
+        label = dict(ELECTIONS)[election]
+
+        bars = []
+        for party in parties:
+            groups = [p['parties'].get(party) for p in precincts]
+            bars.append(go.Bar(
+                name=party or 'None',
+                x=names,
+                y=[g['voted'][election] if g else 0 for g in groups],
+                customdata=[round(100 * g['voted'][election] / g['voters']) if g else 0 for g in groups],
+                hovertemplate='%{x}: %{y} voted (%{customdata}% of party)',
+            ))
+
+        layout = go.Layout(
+            title=f"Turnout by Precinct: {label}",
+            xaxis_title="Precinct",
+            yaxis_title="Number of Voters",
+            barmode='stack',
+        )
+
+        # Obtain the graph as an HTML div
+        return render_chart({"data": bars, "layout": layout})